@@ -0,0 +1,44 @@
+'''
+Purpose: Compare building a deferred report in the app's process against a pool of workers.
+
+Run with:
+    python benchmarks/bench_parallel.py [tables] [rows] [workers ...]
+'''
+import sys
+import time
+
+from streamlit_report import htmlClass, parallel
+from bench_tables import makeFrame
+
+def build(frames: list, workers: int = None) -> float:
+    '''Records a table for each dataframe, then renders the report and returns the elapsed seconds'''
+    h = htmlClass.html()
+    h.deferred = True
+    h.workers = workers
+    for i, df in enumerate(frames):
+        # Alternate polars and pandas dataframes
+        h.dataframe(df if i % 2 else df.to_pandas())
+
+    start = time.perf_counter()
+    h.generateReport()
+    return time.perf_counter() - start
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+    workers = [int(arg) for arg in sys.argv[3:]] or [2, 4, 8, 16]
+    frames = [makeFrame(rows) for _ in range(count)]
+
+    serial = build(frames)
+    print(f"{'workers':>8} {'seconds':>8} {'speedup':>8}")
+    print(f"{'-':>8} {serial:>7.2f}s {1:>7.1f}x")
+    for n in workers:
+        # Start the workers before timing them
+        build(frames[:2], n)
+        elapsed = build(frames, n)
+        print(f'{n:>8} {elapsed:>7.2f}s {serial / elapsed:>7.1f}x')
+
+    parallel.shutdown()
+
+if __name__ == '__main__':
+    main()
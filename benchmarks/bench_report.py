@@ -0,0 +1,231 @@
+'''
+Purpose: Measure the cost of capturing a report on top of plain streamlit calls, and the
+time and memory taken to generate it, over a matrix of synthetic apps.
+
+Each configuration is a multipage app written to a temporary directory and run headless
+with streamlit's AppTest harness, so no browser or network is needed. The app is run:
+    plain:  with the st.* calls only
+    off:    through Report, with report generation off
+    on:     through Report, with report generation on
+Results are written as json so runs can be compared with --compare.
+
+Run with:
+    python benchmarks/bench_report.py [--pages 1 10] [--elements 1 10] [--rows 1000 100000]
+                                      [--charts 0 5] [--repeat 5] [--output results.json]
+                                      [--compare previous.json]
+'''
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import polars as pl
+import streamlit as st
+import streamlit.logger
+from streamlit.testing.v1 import AppTest
+
+# Synthetic page: a block of every element, repeated, plus the dataframes and charts
+PAGE = '''
+import altair as alt
+import polars as pl
+import streamlit as st
+from streamlit_report import Report
+
+MODE = st.session_state.get('_mode', 'on')
+r = st if MODE == 'plain' else Report()
+
+df = pl.DataFrame({{
+    'id':       pl.int_range({rows}, eager = True),
+    'value':    pl.int_range({rows}, eager = True) * 0.25,
+    'label':    pl.Series([f'item <{{i % 97}}>' for i in range({rows})]),
+}})
+
+for i in range({elements}):
+    r.write(f'# {page} block {{i}}')
+    r.markdown('Some *markdown* with a [link](https://example.com)')
+    r.text('plain text')
+    r.selectbox(f'select {{i}}', ['a', 'b', 'c'])
+    r.multiselect(f'multi {{i}}', ['a', 'b', 'c'], default = ['a'])
+    r.slider(f'slider {{i}}', min_value = 0, max_value = 10, value = (2, 4))
+    r.text_input(f'input {{i}}')
+    r.text_area(f'area {{i}}')
+    r.date_input(f'date {{i}}')
+    for t in r.tabs(['one', 'two'], key = f'tabs {{i}}') if MODE == 'plain' else r.tabs(['one', 'two']):
+        with t:
+            r.write('in a tab')
+    r.dataframe(df)
+
+chart = alt.Chart(df.head(500).to_pandas()).mark_point().encode(x = 'id', y = 'value')
+for i in range({charts}):
+    r.altair_chart(chart)
+
+if MODE != 'plain':
+    r.download()
+'''
+
+def writeApp(directory: Path, pages: int, elements: int, rows: int, charts: int) -> Path:
+    '''Writes a synthetic app with the given number of pages and returns its main script'''
+    (directory / 'pages').mkdir(exist_ok = True)
+    main = directory / 'app.py'
+    for i in range(pages):
+        path = main if i == 0 else directory / 'pages' / f'page_{i}.py'
+        path.write_text(PAGE.format(page = f'page {i}', elements = elements, rows = rows, charts = charts))
+    return main
+
+def pagePaths(main: Path, pages: int) -> list:
+    '''Paths of the app's pages, relative to the main script'''
+    return [main.name] + [f'pages/page_{i}.py' for i in range(1, pages)]
+
+def timeRun(at: AppTest) -> float:
+    '''Runs the app once and returns the elapsed seconds'''
+    start = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return elapsed
+
+def runMode(main: Path, pages: int, mode: str, repeat: int) -> dict:
+    '''Runs every page of the app in the given mode and times reruns of the main page'''
+    at = AppTest.from_file(str(main), default_timeout = 600)
+    at.session_state['_mode'] = mode
+    timeRun(at)
+
+    # Turn the report on
+    if mode == 'on':
+        [b for b in at.button if b.label == 'Generate Report?'][0].click()
+        timeRun(at)
+
+    # Visit each page so the report holds all of them, ending on the main page
+    paths = pagePaths(main, pages)
+    for path in paths[1:] + paths[:1]:
+        at.switch_page(path)
+        timeRun(at)
+
+    runs = [timeRun(at) for _ in range(repeat)]
+    result = {
+        'rerunSeconds':     statistics.median(runs),
+        'rerunMinSeconds':  min(runs),
+    }
+
+    if mode == 'on':
+        result.update(generate(at.session_state['html']))
+    return result
+
+def generate(html) -> dict:
+    '''Times a full generateReport of the session's report and measures its memory'''
+    # Make sure the report is built again
+    html.report = None
+    html.reportKey = None
+    for page in html.pages:
+        page.fragments = None
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    report = html.generateReport()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    summary = html.statsSummary()
+    elements = {
+        kind: totals['seconds'] / totals['count']
+        for kind, totals in summary['kinds'].items() if totals['count']
+    }
+    return {
+        'generateSeconds':      elapsed,
+        'generatePeakBytes':    peak,
+        'reportBytes':          len(report.encode('utf-8')),
+        'retainedBytes':        summary['retained']['bytes'],
+        'elementSeconds':       elements,
+    }
+
+def runConfig(pages: int, elements: int, rows: int, charts: int, repeat: int) -> dict:
+    '''Benchmarks one configuration of the matrix'''
+    with tempfile.TemporaryDirectory(prefix = 'streamlit_report-bench-') as directory:
+        main = writeApp(Path(directory), pages, elements, rows, charts)
+        modes = {mode: runMode(main, pages, mode, repeat) for mode in ('plain', 'off', 'on')}
+
+    plain = modes['plain']['rerunSeconds']
+    return {
+        'config':   {'pages': pages, 'elements': elements, 'rows': rows, 'charts': charts},
+        'modes':    modes,
+        'overhead': {
+            'off':  modes['off']['rerunSeconds'] / plain,
+            'on':   modes['on']['rerunSeconds'] / plain,
+        },
+    }
+
+def environment() -> dict:
+    '''Versions and machine details stored with the results'''
+    return {
+        'time':         time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python':       platform.python_version(),
+        'platform':     platform.platform(),
+        'processor':    platform.processor(),
+        'streamlit':    st.__version__,
+        'polars':       pl.__version__,
+    }
+
+def compare(results: list, previous: dict) -> None:
+    '''Prints the change in each measurement against an earlier run'''
+    old = {json.dumps(r['config'], sort_keys = True): r for r in previous['results']}
+    print(f"\n{'config':<48} {'measure':<22} {'before':>10} {'after':>10} {'change':>8}")
+    for result in results:
+        key = json.dumps(result['config'], sort_keys = True)
+        if key not in old:
+            continue
+
+        for mode, measure in (('plain', 'rerunSeconds'), ('off', 'rerunSeconds'), ('on', 'rerunSeconds'),
+                              ('on', 'generateSeconds'), ('on', 'generatePeakBytes')):
+            before = old[key]['modes'][mode][measure]
+            after = result['modes'][mode][measure]
+            change = (after - before) / before * 100 if before else 0.0
+            print(f'{key:<48} {mode + " " + measure:<22} {before:>10.4g} {after:>10.4g} {change:>+7.1f}%')
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type = int, nargs = '+', default = [1, 5])
+    parser.add_argument('--elements', type = int, nargs = '+', default = [1, 10])
+    parser.add_argument('--rows', type = int, nargs = '+', default = [1_000, 50_000])
+    parser.add_argument('--charts', type = int, nargs = '+', default = [0, 5])
+    parser.add_argument('--repeat', type = int, default = 5, help = 'Reruns timed for each mode')
+    parser.add_argument('--output', help = 'Json file for the results, defaults to bench_report-<time>.json')
+    parser.add_argument('--compare', help = 'Json results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    # Streamlit warns about the missing server context on every run
+    streamlit.logger.set_log_level('error')
+
+    results = []
+    print(f"{'pages':>6} {'elements':>9} {'rows':>8} {'charts':>7} {'plain':>9} {'off':>9} {'on':>9} {'generate':>9} {'peak MB':>8}")
+    for pages, elements, rows, charts in itertools.product(args.pages, args.elements, args.rows, args.charts):
+        result = runConfig(pages, elements, rows, charts, args.repeat)
+        results.append(result)
+
+        modes = result['modes']
+        print(
+            f"{pages:>6} {elements:>9} {rows:>8} {charts:>7} "
+            f"{modes['plain']['rerunSeconds']:>8.3f}s {modes['off']['rerunSeconds']:>8.3f}s "
+            f"{modes['on']['rerunSeconds']:>8.3f}s {modes['on']['generateSeconds']:>8.4f}s "
+            f"{modes['on']['generatePeakBytes'] / 1e6:>8.1f}"
+        )
+
+    # Save the results
+    output = args.output or f"bench_report-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent = 2)
+    print(f'\nResults written to {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+'''
+Purpose: Compare the native table renderer against the pandas html formatter.
+
+Run with:
+    python benchmarks/bench_tables.py [rows ...]
+'''
+import sys
+import time
+
+import polars as pl
+from streamlit_report import tables
+
+def makeFrame(rows: int) -> pl.DataFrame:
+    '''Synthetic dataframe with a mix of column types'''
+    return pl.DataFrame({
+        'id':       pl.int_range(rows, eager = True),
+        'value':    pl.int_range(rows, eager = True) * 0.25,
+        'label':    pl.Series([f'item <{i % 97}> & co' for i in range(rows)]),
+        'flag':     pl.int_range(rows, eager = True) % 2 == 0,
+    })
+
+def timeit(func, *args) -> float:
+    '''Runs the function once and returns the elapsed seconds'''
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+def previous(df: pl.DataFrame) -> str:
+    '''The renderer used before the native one: convert to pandas and use to_html'''
+    return df.to_pandas().to_html(index = False)
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+
+    print(f"{'rows':>10} {'to_pandas().to_html':>20} {'polarsTable':>12} {'pandasTable':>12} {'speedup':>8}")
+    for rows in sizes:
+        df = makeFrame(rows)
+        pdf = df.to_pandas()
+
+        old = timeit(previous, df)
+        native = timeit(tables.polarsTable, df)
+        fast = timeit(tables.pandasTable, pdf)
+
+        print(f'{rows:>10} {old:>19.3f}s {native:>11.3f}s {fast:>11.3f}s {old / native:>7.1f}x')
+
+if __name__ == '__main__':
+    main()
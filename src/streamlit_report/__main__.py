@@ -0,0 +1,9 @@
+'''
+Purpose: Run the batch report command with python -m streamlit_report, see cli.py
+'''
+import sys
+
+from streamlit_report.cli import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+'''
+   Copyright 2024 Nick Xydis
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Purpose: Assemble reports on background threads so the app doesn't wait for them.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+import tempfile
+import threading
+
+from streamlit_report.htmlClass import ReportSnapshot, writeChunks
+
+# Most reports assembled at the same time by the process
+MAX_WORKERS = 2
+
+_executor = None
+_lock = threading.Lock()
+
+def executor() -> ThreadPoolExecutor:
+    '''Returns the thread pool shared by every session, creating it the first time'''
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix = 'streamlit_report-assembly')
+        return _executor
+
+class Cancelled(Exception):
+    '''Raised in an assembly that was cancelled or superseded'''
+
+class AssemblyJob:
+    '''
+    Writes a report snapshot to a temporary file on the shared thread pool.
+        snapshot:       Pieces of the report, see html.snapshot()
+        compression:    Optional 'gzip' or 'selfExtracting', see html.compressReport
+    '''
+    def __init__(self, snapshot: ReportSnapshot, compression: str = None):
+        self.snapshot = snapshot
+        self.compression = compression
+        self.written = 0                        # Characters of the report written so far
+        self.file = None                        # Temporary file with the finished report
+        self.cancelled = threading.Event()
+        self.future = executor().submit(self.run)
+
+    @property
+    def progress(self) -> float:
+        '''Fraction of the report written so far'''
+        if self.snapshot.size == 0:
+            return 1.0
+        return min(self.written / self.snapshot.size, 1.0)
+
+    @property
+    def done(self) -> bool:
+        '''True once the job has finished, failed or been cancelled'''
+        return self.future.done()
+
+    @property
+    def error(self):
+        '''The exception the job failed with, if any'''
+        if not self.done or self.future.cancelled():
+            return None
+        return self.future.exception()
+
+    def chunks(self):
+        '''Pieces of the snapshot, stopping if the job is cancelled'''
+        for chunk in self.snapshot.chunks():
+            if self.cancelled.is_set():
+                raise Cancelled()
+            self.written += len(chunk)
+            yield chunk
+
+    def run(self) -> None:
+        '''Writes the report, called on the thread pool'''
+        f = tempfile.TemporaryFile()
+        try:
+            writeChunks(self.chunks(), f, self.compression)
+            f.flush()
+        except BaseException:
+            f.close()
+            raise
+
+        # A job cancelled while it was finishing doesn't keep its file
+        if self.cancelled.is_set():
+            f.close()
+            raise Cancelled()
+        self.file = f
+
+    def matches(self, snapshot: ReportSnapshot, compression: str = None) -> bool:
+        '''Checks whether the job is building the same report'''
+        return self.compression == compression and self.snapshot.key == snapshot.key
+
+    def result(self):
+        '''Returns the finished report as a raw file object, for the download button'''
+        self.future.result()
+
+        # NOTE: Streamlit reads raw file objects, not buffered ones
+        return self.file.raw
+
+    def cancel(self) -> None:
+        '''Stops the job if it's still running and removes its file'''
+        self.cancelled.set()
+        self.future.cancel()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,113 @@
+'''
+   Copyright 2024 Nick Xydis
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Purpose: Load the static files used in reports once per process and share them between sessions.
+'''
+
+import os
+import threading
+
+# Cached files: path -> (modification time, size, contents)
+_files = {}
+_lock = threading.Lock()
+
+# Cached vega runtimes built by vl-convert: vega-lite version -> script
+_runtimes = {}
+
+# Files expected in a local vega bundle directory, in load order
+VEGA_FILES = ('vega.min.js', 'vega-lite.min.js', 'vega-embed.min.js')
+
+def findFile(name: str) -> str:
+    '''Returns the path of a file in the dashboard directory, or else in this module's directory'''
+    if os.path.isfile(name):
+        return os.path.abspath(name)
+    return os.path.join(os.path.dirname(__file__), name)
+
+def readFile(name: str, transform = None) -> str:
+    '''
+    Returns the contents of the file, only reading it again if it changed on disk.
+        transform:  Optional function applied to the contents before they're cached
+    NOTE: Every caller gets the same string object until the file changes.
+    '''
+    path = findFile(name)
+    stat = os.stat(path)
+    key = (path, transform)
+
+    # Reuse the cached contents if the file hasn't changed
+    cached = _files.get(key)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    with open(path) as f:
+        text = f.read()
+    if transform is not None:
+        text = transform(text)
+
+    with _lock:
+        _files[key] = (stat.st_mtime_ns, stat.st_size, text)
+
+    return text
+
+def inlineScript(code: str) -> str:
+    '''Wraps javascript in a script block'''
+    # NOTE: A literal "</script" would end the block early, "<\/" means the same in javascript
+    return '<script type="text/javascript">\n' + code.replace('</script', '<\\/script') + '\n</script>\n'
+
+def vegaConverter() -> tuple:
+    '''Returns the vl-convert module and the vega-lite version altair uses'''
+    try:
+        import vl_convert as vlc
+        from altair.utils._importers import vl_version_for_vl_convert
+    except ImportError:
+        raise ImportError('Converting charts needs the vl-convert-python package')
+
+    return vlc, vl_version_for_vl_convert()
+
+def vegaRuntime(bundleDir: str = None) -> str:
+    '''
+    Returns script blocks with vega, vega-lite and vega-embed inlined, so charts render
+    without network access. The runtime is built once per process.
+        bundleDir:  Directory holding vega.min.js, vega-lite.min.js and vega-embed.min.js.
+                    If None, the runtime is bundled by the vl-convert-python package.
+    '''
+    # Read the files from the local bundle
+    if bundleDir:
+        missing = [name for name in VEGA_FILES if not os.path.isfile(os.path.join(bundleDir, name))]
+        if missing:
+            raise FileNotFoundError(f'Vega bundle directory {bundleDir!r} is missing {", ".join(missing)}')
+        return ''.join(readFile(os.path.join(bundleDir, name), inlineScript) for name in VEGA_FILES)
+
+    # Otherwise use vl-convert's bundle for the vega-lite version altair uses
+    try:
+        vlc, version = vegaConverter()
+    except ImportError:
+        raise ImportError(
+            'Offline reports need the vl-convert-python package, or a bundleDir '
+            'with the vega javascript files'
+        )
+
+    runtime = _runtimes.get(version)
+    if runtime is None:
+        runtime = inlineScript(vlc.javascript_bundle(vl_version = version))
+        with _lock:
+            _runtimes[version] = runtime
+
+    return runtime
+
+def clear() -> None:
+    '''Forgets every cached file'''
+    with _lock:
+        _files.clear()
+        _runtimes.clear()
@@ -0,0 +1,186 @@
+'''
+   Copyright 2024 Nick Xydis
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Purpose: Caches and stores shared by every session in the process.
+'''
+
+from collections import OrderedDict
+import hashlib
+import threading
+import weakref
+
+class LRUCache:
+    '''
+    Thread-safe least-recently-used cache with a limit on both the number of entries
+    and the approximate number of bytes they hold.
+        maxEntries: Most entries to keep
+        maxBytes:   Most characters of keys and values to keep. If None, only the
+                    number of entries is limited.
+    '''
+    def __init__(self, maxEntries: int = 1024, maxBytes: int = None):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()    # key -> (value, size)
+        self.size = 0                   # Characters held by the cache
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def sizeOf(key, value) -> int:
+        '''Approximate size of an entry'''
+        size = len(value) if isinstance(value, (str, bytes)) else 0
+        if isinstance(key, tuple):
+            size += sum(len(k) for k in key if isinstance(k, (str, bytes)))
+        elif isinstance(key, (str, bytes)):
+            size += len(key)
+        return size
+
+    def get(self, key, default = None):
+        '''Returns the cached value, marking it as recently used'''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value) -> None:
+        '''Adds a value to the cache, evicting the least recently used entries if needed'''
+        size = self.sizeOf(key, value)
+
+        # Values bigger than the whole cache aren't worth keeping
+        if self.maxBytes is not None and size > self.maxBytes:
+            return
+
+        with self.lock:
+            # Replace any existing entry
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+
+            self.entries[key] = (value, size)
+            self.size += size
+
+            # Evict until we're back within our limits
+            while len(self.entries) > self.maxEntries or (
+                    self.maxBytes is not None and self.size > self.maxBytes):
+                _, (_, evicted) = self.entries.popitem(last = False)
+                self.size -= evicted
+                self.evictions += 1
+
+    def clear(self) -> None:
+        '''Removes every entry and resets the counts'''
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> dict:
+        '''Hit, miss and size counts for monitoring'''
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries':      len(self.entries),
+                'bytes':        self.size,
+                'hits':         self.hits,
+                'misses':       self.misses,
+                'evictions':    self.evictions,
+                'hitRate':      self.hits / lookups if lookups else 0.0,
+                'maxEntries':   self.maxEntries,
+                'maxBytes':     self.maxBytes,
+            }
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+class SharedFragment:
+    '''Rendered code held once by the fragment store and referenced by any number of pages'''
+    __slots__ = ('text', 'key', 'holders', 'store', '__weakref__')
+
+    def __init__(self, text: str, key: bytes, store: 'FragmentStore'):
+        self.text = text
+        self.key = key
+        self.holders = 0            # Number of pages holding the fragment
+        self.store = store
+
+    def release(self) -> None:
+        '''Called when a page no longer holds the fragment'''
+        self.store.release(self)
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def __str__(self) -> str:
+        return self.text
+
+class FragmentStore:
+    '''
+    Process-wide store of rendered code (tables, chart specs, markdown) keyed by a hash
+    of the content, so sessions that render the same content hold one shared copy.
+    Fragments are held weakly and go away once no page refers to them.
+        minSize:    Smallest fragment worth sharing, in characters
+    '''
+    def __init__(self, minSize: int = 1024):
+        self.minSize = minSize
+        self.fragments = weakref.WeakValueDictionary()  # content hash -> SharedFragment
+        self.requests = 0           # Fragments offered to the store
+        self.hits = 0               # Fragments that were already in the store
+        self.lock = threading.Lock()
+
+    def share(self, text: str):
+        '''Returns the shared fragment for the text, or the text itself if it's too small'''
+        if len(text) < self.minSize:
+            return text
+
+        key = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size = 20).digest()
+        with self.lock:
+            self.requests += 1
+            fragment = self.fragments.get(key)
+            if fragment is None:
+                fragment = SharedFragment(text, key, self)
+                self.fragments[key] = fragment
+            else:
+                self.hits += 1
+            fragment.holders += 1
+
+        return fragment
+
+    def release(self, fragment: SharedFragment) -> None:
+        '''Called when a page no longer holds the fragment'''
+        with self.lock:
+            fragment.holders = max(fragment.holders - 1, 0)
+
+    def stats(self) -> dict:
+        '''Number of shared fragments and the memory saved by sharing them'''
+        with self.lock:
+            fragments = list(self.fragments.values())
+            return {
+                'fragments':    len(fragments),
+                'references':   sum(f.holders for f in fragments),
+                'bytes':        sum(len(f) for f in fragments),
+                'savedBytes':   sum(len(f) * (f.holders - 1) for f in fragments if f.holders > 1),
+                'requests':     self.requests,
+                'hits':         self.hits,
+            }
+
+# Fragments shared between the sessions of this process
+fragmentStore = FragmentStore()
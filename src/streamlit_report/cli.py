@@ -0,0 +1,324 @@
+'''
+   Copyright 2024 Nick Xydis
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Purpose: Write reports from a Report app without a browser, one for each set of parameters.
+
+Each run starts the app headless with streamlit's AppTest harness and the report turned on,
+visits every page, and writes the report to the output directory. Every run has a process
+of its own, which is stopped if the run takes longer than the timeout, and up to --workers
+runs happen at the same time.
+
+Run with:
+    streamlit-report app.py --params params.json --output reports/ [--workers 4] [--timeout 300]
+    python -m streamlit_report app.py --params params.json --output reports/
+
+Parameter files hold one parameter set per report, either as a json list, as json lines
+(.jsonl) or as a csv file whose columns are query parameters. Each set may have:
+    name:       Name of the report file, defaults to its position in the file
+    query:      Query parameters, see st.query_params
+    session:    Session state values set before the app first runs
+    widgets:    Widget values by key or label, set on the page the widget is on
+e.g.
+    [{"name": "acme", "query": {"customer": "acme"}, "widgets": {"Region": "West"}}]
+'''
+
+import argparse
+import csv
+import datetime
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Widget types that parameter sets can fill in, by their AppTest attribute
+WIDGETS = (
+    'checkbox', 'color_picker', 'date_input', 'multiselect', 'number_input', 'radio',
+    'select_slider', 'selectbox', 'slider', 'text_area', 'text_input', 'time_input', 'toggle',
+)
+
+def readParams(path: str) -> list:
+    '''Reads the parameter sets from a json, json lines or csv file'''
+    path = Path(path)
+    if path.suffix == '.csv':
+        with open(path, newline = '', encoding = 'utf-8') as f:
+            rows = list(csv.DictReader(f))
+        return [
+            {'name': row.pop('name', None), 'query': row}
+            for row in rows
+        ]
+
+    with open(path, encoding = 'utf-8') as f:
+        if path.suffix == '.jsonl':
+            sets = [json.loads(line) for line in f if line.strip()]
+        else:
+            sets = json.load(f)
+
+    if not isinstance(sets, list) or not all(isinstance(params, dict) for params in sets):
+        raise ValueError(f'{path} should hold a list of parameter sets')
+    return sets
+
+def reportName(params: dict, index: int) -> str:
+    '''File name for a parameter set's report, without the extension'''
+    name = str(params.get('name') or f'report_{index + 1:04d}')
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('._') or f'report_{index + 1:04d}'
+
+def appPages(script: str, pages: list = None) -> list:
+    '''Paths of the app's pages relative to the main script: the main script, then the
+    files in its pages directory, unless the pages are given'''
+    main = Path(script)
+    if pages:
+        return [main.name] + [page for page in pages if page != main.name]
+
+    directory = main.parent / 'pages'
+    extra = sorted(path.relative_to(main.parent).as_posix() for path in directory.glob('*.py')) if directory.is_dir() else []
+    return [main.name] + extra
+
+def widgetValue(kind: str, value):
+    '''Converts a json value to what the widget expects'''
+    if kind == 'date_input':
+        if isinstance(value, list):
+            return tuple(datetime.date.fromisoformat(v) for v in value)
+        return datetime.date.fromisoformat(value) if isinstance(value, str) else value
+    if kind == 'time_input' and isinstance(value, str):
+        return datetime.time.fromisoformat(value)
+    if kind in ('slider', 'select_slider') and isinstance(value, list):
+        return tuple(value)
+    return value
+
+def setWidgets(at, widgets: dict) -> bool:
+    '''Sets the widgets on the current page that are named in the parameter set, by key or
+    label. Returns True if any were set.'''
+    changed = False
+    for kind in WIDGETS:
+        for widget in getattr(at, kind):
+            for name in (widget.key, widget.label):
+                if name is not None and name in widgets:
+                    widget.set_value(widgetValue(kind, widgets[name]))
+                    changed = True
+                    break
+    return changed
+
+def newResult(params: dict, output: str) -> dict:
+    '''Result of a job that hasn't written its report'''
+    return {'name': params.get('name'), 'output': output, 'ok': False, 'timedOut': False, 'error': None, 'bytes': 0}
+
+def runJob(script: str, pages: list, params: dict, output: str, timeout: float, compression: str = None) -> dict:
+    '''
+    Writes one report: runs every page of the app with the parameter set and the report
+    turned on, then writes the report to the output path.
+        timeout:    Seconds the whole job may take
+    NOTE: The report is written next to the output and moved into place once it's complete,
+          so a job that is stopped never leaves part of a report behind
+    '''
+    import streamlit.logger
+    from streamlit.testing.v1 import AppTest
+
+    # Streamlit warns about the missing server context on every run
+    streamlit.logger.set_log_level('error')
+
+    start = time.perf_counter()
+    result = newResult(params, output)
+    def run(at) -> None:
+        remaining = timeout - (time.perf_counter() - start)
+        if remaining <= 0:
+            raise TimeoutError(f'Timed out after {timeout}s')
+        at.run(timeout = remaining)
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+    try:
+        at = AppTest.from_file(script, default_timeout = timeout)
+        for key, value in (params.get('query') or {}).items():
+            at.query_params[key] = value
+        for key, value in (params.get('session') or {}).items():
+            at.session_state[key] = value
+
+        # Turn the report on, in place of the Generate Report? button
+        at.session_state['htmlReport'] = True
+
+        # Visit each page, setting its widgets
+        widgets = params.get('widgets') or {}
+        for i, page in enumerate(pages):
+            if i:
+                at.switch_page(page)
+            run(at)
+            if widgets and setWidgets(at, widgets):
+                run(at)
+
+        html = at.session_state['html']
+        html.writeReport(output + '.tmp', compression)
+        os.replace(output + '.tmp', output)
+        result['bytes'] = os.path.getsize(output)
+        result['ok'] = True
+
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+        result['timedOut'] = isinstance(e, TimeoutError) or 'timed out' in str(e)
+
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def jobProcess(connection, *args) -> None:
+    '''Runs one job in its own process and sends back the result, see runJob'''
+    connection.send(runJob(*args))
+    connection.close()
+
+class Job:
+    '''
+    A job running in a process of its own
+        context:    Multiprocessing context the process is started with
+        args:       Arguments of runJob
+    '''
+    def __init__(self, context, args: tuple):
+        self.params, self.output, self.timeout = args[2], args[3], args[4]
+        self.connection, send = context.Pipe(duplex = False)
+        self.process = context.Process(target = jobProcess, args = (send, *args))
+        self.start = time.perf_counter()
+        self.process.start()
+        send.close()
+
+    @property
+    def deadline(self) -> float:
+        return self.start + self.timeout
+
+    def result(self) -> dict:
+        '''Returns the job's result once it has finished, failed or run out of time,
+        stopping the process if it's still running, otherwise None'''
+        result = None
+        if self.connection.poll():
+            try:
+                result = self.connection.recv()
+            except EOFError:
+                pass
+
+        if result is None:
+            if self.process.is_alive() and time.perf_counter() < self.deadline:
+                return None
+
+            # Stop the job where it is
+            result = newResult(self.params, self.output)
+            if self.process.is_alive():
+                self.process.terminate()
+                result['timedOut'] = True
+                result['error'] = f'TimeoutError: Stopped after {self.timeout}s'
+            else:
+                result['error'] = f'Worker exited with code {self.process.exitcode}'
+            result['seconds'] = time.perf_counter() - self.start
+
+            # Remove the part of the report it was writing
+            if os.path.exists(self.output + '.tmp'):
+                os.remove(self.output + '.tmp')
+
+        self.process.join()
+        self.connection.close()
+        return result
+
+    def stop(self) -> None:
+        '''Stops the job's process'''
+        self.process.terminate()
+        self.process.join()
+        self.connection.close()
+
+def summary(results: list, elapsed: float) -> str:
+    '''Throughput summary of a batch'''
+    done = [r for r in results if r['ok']]
+    timedOut = [r for r in results if r['timedOut']]
+    failed = len(results) - len(done) - len(timedOut)
+    seconds = sorted(r['seconds'] for r in done)
+    size = sum(r['bytes'] for r in done)
+
+    lines = [
+        f'{len(results)} jobs in {elapsed:.1f}s: {len(done)} written, {failed} failed, {len(timedOut)} timed out',
+        f'throughput: {len(done) / elapsed:.2f} reports/s, {size / 1e6 / elapsed:.2f} MB/s ({size / 1e6:.1f} MB)',
+    ]
+    if seconds:
+        p95 = seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))]
+        lines.append(f'job time: median {statistics.median(seconds):.2f}s, p95 {p95:.2f}s, max {seconds[-1]:.2f}s')
+    return '\n'.join(lines)
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog = 'streamlit-report', description = __doc__.split('Purpose: ')[-1],
+        formatter_class = argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('script', help = 'Main script of the app')
+    parser.add_argument('--params', required = True, help = 'Parameter sets, one report each (.json, .jsonl or .csv)')
+    parser.add_argument('--output', default = 'reports', help = 'Directory for the reports')
+    parser.add_argument('--workers', type = int, default = os.cpu_count() or 1, help = 'Reports written at the same time')
+    parser.add_argument('--timeout', type = float, default = 300, help = 'Seconds each report may take')
+    parser.add_argument('--pages', nargs = '+', help = 'Pages to visit, relative to the main script. Defaults to the pages directory')
+    parser.add_argument('--compression', choices = ['gzip', 'selfExtracting'], help = 'Compress the reports')
+    args = parser.parse_args(argv)
+
+    script = os.path.abspath(args.script)
+    pages = appPages(script, args.pages)
+    sets = readParams(args.params)
+    os.makedirs(args.output, exist_ok = True)
+
+    # Each report is written to its own file
+    suffix = '.html.gz' if args.compression == 'gzip' else '.html'
+    names, jobs = set(), []
+    for i, params in enumerate(sets):
+        name = reportName(params, i)
+        if name in names:
+            name = f'{name}_{i + 1}'
+        names.add(name)
+        jobs.append((params, os.path.join(args.output, name + suffix)))
+
+    print(f'Writing {len(jobs)} reports from {args.script} ({len(pages)} pages) with {args.workers} workers')
+    start = time.perf_counter()
+    results = []
+
+    # NOTE: Jobs are spawned, so each starts with a clean streamlit runtime
+    context = multiprocessing.get_context('spawn')
+    waiting, running = list(jobs), []
+    try:
+        while waiting or running:
+            # Start jobs until every worker is busy
+            while waiting and len(running) < max(1, args.workers):
+                params, output = waiting.pop(0)
+                running.append(Job(context, (script, pages, params, output, args.timeout, args.compression)))
+
+            # Wait for a job to finish or reach its deadline
+            ready = [job.connection for job in running] + [job.process.sentinel for job in running]
+            deadline = min(job.deadline for job in running)
+            multiprocessing.connection.wait(ready, timeout = max(0, deadline - time.perf_counter()))
+
+            for job in list(running):
+                result = job.result()
+                if result is None:
+                    continue
+                running.remove(job)
+                results.append(result)
+                status = 'ok' if result['ok'] else ('timed out' if result['timedOut'] else 'failed')
+                print(f"[{len(results)}/{len(jobs)}] {result['output']}: {status} in {result['seconds']:.2f}s"
+                      + (f" ({result['error']})" if result['error'] else ''))
+
+    # Don't leave jobs running if the batch is interrupted
+    finally:
+        for job in running:
+            job.stop()
+
+    print()
+    print(summary(results, time.perf_counter() - start))
+    return 0 if all(r['ok'] for r in results) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,293 @@
+'''
+   Copyright 2024 Nick Xydis
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Purpose: Export a report as a directory of pages that is updated in place, rewriting only
+the pages that changed since the last export.
+
+Layout of the directory:
+    index.html              Links to every page
+    <number>_<name>.html    One file per page
+    assets/report.css       The style file's styles
+    assets/report.js        The tab, navigation and virtual table scripts
+    assets/nav.js           The list of pages, shown in the navigation of every page
+    assets/vega.js          The vega runtime, for offline reports with charts
+    manifest.json           The files written, with a hash of their sources and contents
+'''
+
+import hashlib
+import json
+import os
+import re
+import time
+
+from streamlit_report.tables import escape
+
+MANIFEST = 'manifest.json'
+MANIFEST_VERSION = 1
+ASSETS = 'assets'
+
+# Style and script blocks of the report's templates
+STYLE_BLOCK = re.compile(r'<style[^>]*>(.*?)</style>\s*', re.S | re.I)
+SCRIPT_BLOCK = re.compile(r'<script[^>]*>(.*?)</script>', re.S | re.I)
+
+# Builds the page links in the navigation of every page, from assets/nav.js
+NAV_SCRIPT = '''
+// Add a link for each page of the report to the page navigation
+(function () {
+var links = document.getElementById("pageLinks");
+if (!links || reportPages.length <= 1) {
+    return;
+}
+for (var p = 0; p < reportPages.length; p++) {
+    var link = document.createElement("a");
+    link.className = "page_link";
+    link.href = reportPages[p][1];
+    link.textContent = reportPages[p][0];
+    links.appendChild(link);
+}
+})();
+'''
+
+def scriptText(code: str) -> str:
+    '''The javascript inside the script blocks of the code'''
+    return '\n'.join(block.strip('\n') for block in SCRIPT_BLOCK.findall(code)) + '\n'
+
+def fileName(number: int, name: str) -> str:
+    '''File name for a page, safe to use on any file system'''
+    slug = re.sub(r'[^A-Za-z0-9_-]+', '_', str(name)).strip('_')[:64]
+    return f'{number}_{slug or "page"}.html'
+
+def digest(*parts) -> str:
+    '''Hash of the given strings and keys'''
+    h = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, str):
+            part = repr(part)
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def readManifest(directory: str) -> dict:
+    '''The manifest of the last export to the directory, or an empty one'''
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding = 'utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'files': {}}
+
+def writeFile(directory: str, name: str, pieces) -> dict:
+    '''Writes the pieces of a file, replacing the old file in one step so readers of the
+    directory never see a partly written file. Returns its manifest entry.'''
+    path = os.path.join(directory, name)
+    h = hashlib.sha256()
+    size = 0
+    def chunks():
+        nonlocal size
+        for piece in pieces:
+            for chunk in (piece,) if isinstance(piece, str) else piece.chunks():
+                data = chunk.encode('utf-8')
+                h.update(data)
+                size += len(data)
+                yield data
+
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+        for data in chunks():
+            f.write(data)
+    os.replace(temp, path)
+    return {'sha256': h.hexdigest(), 'bytes': size}
+
+class DirectoryExport:
+    '''
+    Writes a report to a directory. Each file's entry in the manifest holds a key made
+    from the code it was built from; files whose key hasn't changed are left as they are.
+        report:     The report's html object, see htmlClass.html
+        directory:  Directory to write to, created if it doesn't exist
+    '''
+    def __init__(self, report, directory: str):
+        self.report = report
+        self.directory = os.fspath(directory)
+        self.old = {}               # Manifest entries of the last export, by file name
+        self.files = {}             # Manifest entries of this export, by file name
+        self.written = []           # Files written by this export
+        self.unchanged = []         # Files left as they were
+
+    def update(self, name: str, key: str, pieces) -> None:
+        '''Writes a file unless the last export wrote the same one
+            pieces: The file's code, or a function returning it, so unchanged files aren't built'''
+        old = self.old.get(name)
+        path = os.path.join(self.directory, name)
+        if old is not None and old.get('key') == key and os.path.isfile(path) and os.path.getsize(path) == old.get('bytes'):
+            self.files[name] = old
+            self.unchanged.append(name)
+            return
+
+        entry = writeFile(self.directory, name, pieces() if callable(pieces) else pieces)
+        self.files[name] = {'key': key, **entry}
+        self.written.append(name)
+
+    def head(self, charts: bool) -> list:
+        '''Header code for every file: the style file without its styles, which are in
+        assets/report.css, and the chart runtime if the page has charts'''
+        report = self.report
+        pieces = [STYLE_BLOCK.sub('', report.head), '<link rel="stylesheet" href="assets/report.css">\n']
+        if charts:
+            pieces.append('<script src="assets/vega.js"></script>\n' if report.offline else report.altairHeader())
+        pieces.append('</head>\n')
+        return pieces
+
+    def writeAssets(self, pages: list) -> None:
+        '''Writes the style and script files shared by every page'''
+        report = self.report
+        os.makedirs(os.path.join(self.directory, ASSETS), exist_ok = True)
+
+        css = '\n'.join(block.strip('\n') for block in STYLE_BLOCK.findall(report.head)) + '\n'
+        self.update(f'{ASSETS}/report.css', digest(css), [css])
+
+        script = scriptText(report.script) + scriptText(report.tableCode())
+        self.update(f'{ASSETS}/report.js', digest(script), [script])
+
+        nav = 'var reportPages = ' + json.dumps([[name, file] for name, file in pages]) + ';\n' + NAV_SCRIPT
+        self.update(f'{ASSETS}/nav.js', digest(nav), [nav])
+
+        # The offline runtime is kept once, instead of in every page
+        if report.offline and any(report.chartScript.values()):
+            runtime = report.altairHeader()
+            self.update(f'{ASSETS}/vega.js', digest(runtime), lambda: [scriptText(runtime)])
+
+    def pagePieces(self, page, name: str, head: list) -> list:
+        '''The code of one page file'''
+        report = self.report
+        template = report.template
+        pieces = head + [template(f'''<body onload = "openNav()">
+        <div id = "pageNav" class = "sidenav">
+        <a href="javascript:void(0)" class="closebtn" onclick="closeNav()">&times;</a>
+        <a href = "index.html" class = "page_link">Index</a>
+        <div id = "pageLinks"></div>
+        <div class = "sidebar" id = "{name}_{page.number}_sidebar">
+        '''), page.sidebar.piece(), template(f'''
+        </div>
+        </div>
+        <div class = "content" id = "{name}_{page.number}">
+        '''), page.body.piece(), template('''
+        </div>
+        ''')]
+
+        # The page's charts and their data
+        if page.chartScript:
+            pieces += report.datasetPieces(page.datasets)
+            if report.lazyPages:
+                pieces.append(template(report.lazyChartCode()))
+            pieces += [page.chartScript.piece(), template('\n</script>\n')]
+
+        pieces.append(template('''</body>
+        <script src="assets/nav.js"></script>
+        <script src="assets/report.js"></script>
+        </html>'''))
+        return pieces
+
+    def pageKey(self, page, name: str, head: list) -> str:
+        '''Key for a page file, made from the code it's built from
+        NOTE: Dataset names are hashes of their contents, so the names stand in for the data'''
+        report = self.report
+        return digest(
+            MANIFEST_VERSION, name, page.number, report.compact, report.lazyPages, ''.join(head),
+            page.sidebar.contentKey(), page.body.contentKey(), page.chartScript.contentKey(),
+            sorted(page.datasets) if page.chartScript else (),
+        )
+
+    def indexPieces(self, pages: list, head: list) -> list:
+        '''The code of the index file'''
+        links = ''.join(
+            f'<li><a href = "{file}">{escape(name)}</a></li>\n' for name, file in pages
+        )
+        return head + [self.report.template('''<body onload = "openNav()">
+        <div id = "pageNav" class = "sidenav">
+        <a href="javascript:void(0)" class="closebtn" onclick="closeNav()">&times;</a>
+        <div id = "pageLinks"></div>
+        </div>
+        <div class = "content">
+        <ul class = "report-index">
+        '''), links, self.report.template('''</ul>
+        </div>
+        </body>
+        <script src="assets/nav.js"></script>
+        <script src="assets/report.js"></script>
+        </html>''')]
+
+    def run(self) -> dict:
+        '''Writes the report and returns a summary of the files written, left unchanged and removed'''
+        report = self.report
+        start = time.perf_counter()
+
+        # Render anything that was recorded in deferred mode
+        report.render()
+
+        os.makedirs(self.directory, exist_ok = True)
+        manifest = readManifest(self.directory)
+        self.old = manifest['files']
+
+        # Pages with content, in the report's order
+        pages = []
+        for name in report.pages.order():
+            page = report.pages[report.pageNames[name]]
+            pages.append((name, fileName(page.number, name), page))
+        links = [(name, file) for name, file, _ in pages]
+
+        self.writeAssets(links)
+
+        # Each page, rewritten only if its code changed
+        plainHead, chartHead = self.head(False), None
+        for name, file, page in pages:
+            if page.chartScript and chartHead is None:
+                chartHead = self.head(True)
+            head = chartHead if page.chartScript else plainHead
+            self.update(file, self.pageKey(page, name, head), lambda: self.pagePieces(page, name, head))
+
+        self.update('index.html', digest(MANIFEST_VERSION, ''.join(plainHead), links), lambda: self.indexPieces(links, plainHead))
+
+        # Remove the files of pages that are gone
+        removed = []
+        for name in self.old:
+            if name not in self.files:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+                removed.append(name)
+
+        # Save the manifest last, so an interrupted export is redone next time
+        manifest = {
+            'version':  MANIFEST_VERSION,
+            'time':     time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'pages':    [{'name': name, 'number': page.number, 'file': file} for name, file, page in pages],
+            'files':    self.files,
+        }
+        text = json.dumps(manifest, indent = 2)
+        temp = os.path.join(self.directory, MANIFEST + '.tmp')
+        with open(temp, 'w', encoding = 'utf-8') as f:
+            f.write(text)
+        os.replace(temp, os.path.join(self.directory, MANIFEST))
+
+        size = sum(self.files[name]['bytes'] for name in self.written)
+        report.stats.assembled('directory', time.perf_counter() - start, size)
+        return {'written': self.written, 'unchanged': self.unchanged, 'removed': removed}
+
+def exportDirectory(report, directory: str) -> dict:
+    '''Writes the report to a directory, see DirectoryExport'''
+    return DirectoryExport(report, directory).run()
@@ -0,0 +1,146 @@
+'''
+   Copyright 2024 Nick Xydis
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Purpose: Keep the report memory of every session in the process under a budget.
+'''
+
+import threading
+import time
+import weakref
+
+# What happens to the least recently used sessions once the budget is exceeded:
+# 'spill' moves their pages to temporary files, 'evict' drops their pages until they're run again
+GOVERNOR_MODES = ('spill', 'evict')
+
+class MemoryGovernor:
+    '''
+    Tracks the report code retained by each session of the process and, once the total
+    is over budget, frees the memory of the least recently used sessions first.
+        budget: Approximate number of bytes of report code to keep in memory across every
+                session. If None, nothing is freed.
+        mode:   'spill' or 'evict', see GOVERNOR_MODES
+    NOTE: Sizes are in characters of html code
+    '''
+    def __init__(self, budget: int = None, mode: str = 'spill'):
+        self.sessions = weakref.WeakKeyDictionary()     # Report html -> time it was last used
+        self.lock = threading.Lock()
+        self.configure(budget, mode)
+
+        # Accounting
+        self.spills = 0             # Sessions spilled to disk
+        self.evictions = 0          # Sessions whose pages were evicted
+        self.freed = 0              # Characters freed from memory
+
+    def configure(self, budget: int = None, mode: str = 'spill') -> None:
+        '''Sets the budget and what to do once it's exceeded'''
+        if mode not in GOVERNOR_MODES:
+            raise ValueError(f'Unknown governor mode {mode!r}, expected one of {GOVERNOR_MODES}')
+        self.budget = budget
+        self.mode = mode
+
+    def touch(self, html) -> None:
+        '''Marks a session's report as just used, adding it if it's new'''
+        with self.lock:
+            self.sessions[html] = time.monotonic()
+
+    def forget(self, html) -> None:
+        '''Stops tracking a session's report'''
+        with self.lock:
+            self.sessions.pop(html, None)
+
+    def retained(self) -> int:
+        '''Characters of report code held in memory by every session'''
+        with self.lock:
+            sessions = list(self.sessions.keys())
+        return sum(html.retainedMemory() for html in sessions)
+
+    def enforce(self, current = None) -> int:
+        '''
+        Frees the memory of the least recently used sessions until the total is back
+        under budget, and returns the characters freed.
+            current:    The report of the session that's running, which is never evicted.
+                        It's only spilled if freeing every other session wasn't enough.
+        NOTE: Other sessions that are still part way through a run are spilled instead of
+              evicted, otherwise the rest of their run would be written after the evicted note
+        '''
+        if self.budget is None:
+            return 0
+
+        with self.lock:
+            sessions = sorted(self.sessions.items(), key = lambda item: item[1])
+
+        total = sum(html.retainedMemory() for html, _ in sessions)
+        if total <= self.budget:
+            return 0
+
+        # Oldest sessions first
+        freed = 0
+        evict = self.mode == 'evict'
+        for html, _ in sessions:
+            if total - freed <= self.budget:
+                break
+            if html is current:
+                continue
+            freed += self.free(html, evict and not html.running)
+
+        # Then the running session, if we have to
+        if total - freed > self.budget and current is not None:
+            freed += self.free(current, False)
+
+        return freed
+
+    def free(self, html, evict: bool) -> int:
+        '''Frees a session's memory and keeps count'''
+        size = html.releaseMemory(evict)
+        with self.lock:
+            if evict:
+                self.evictions += 1
+            else:
+                self.spills += 1
+            self.freed += size
+        return size
+
+    def stats(self) -> dict:
+        '''Current accounting, for monitoring'''
+        with self.lock:
+            sessions = list(self.sessions.items())
+            counts = {'spills': self.spills, 'evictions': self.evictions, 'freedBytes': self.freed}
+
+        now = time.monotonic()
+        details = [
+            {'bytes': html.retainedMemory(), 'pages': len(html.pages), 'idleSeconds': now - used}
+            for html, used in sessions
+        ]
+        return {
+            'budget':   self.budget,
+            'mode':     self.mode,
+            'bytes':    sum(session['bytes'] for session in details),
+            'sessions': details,
+            **counts,
+        }
+
+# The governor for the sessions of this process
+governor = MemoryGovernor()
+
+def configure(budget: int = None, mode: str = 'spill') -> None:
+    '''
+    Sets the memory budget shared by every session of the process, e.g.
+        governor.configure(2 * 1024 ** 3, mode = 'evict')
+    '''
+    governor.configure(budget, mode)
+
+def stats() -> dict:
+    '''The governor's current accounting, see MemoryGovernor.stats'''
+    return governor.stats()
@@ -18,29 +18,280 @@ Purpose: HTML class for use in generating reports.
 
 import markdown
 import polars as pl
+import base64
+import functools
+import hashlib
+import io
+import json
 import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from streamlit_report import assets
+from streamlit_report.cache import LRUCache, fragmentStore
+from streamlit_report.pageStore import PageStore
+from streamlit_report.pageRegistry import PageRegistry, PageContent
+from streamlit_report.stats import ReportStats
+from streamlit_report import tables
+
+# Rendered markdown shared by every session in the process
+markdownCache = LRUCache(maxEntries = 4096, maxBytes = 16 * 1024 * 1024)
+
+# Chart formats: 'interactive' charts are drawn by vega-embed when the report is opened,
+# 'svg' and 'png' charts are converted to images once, when the report is made
+CHART_FORMATS = ('interactive', 'svg', 'png')
+
+# Converted chart images shared by every session in the process, by spec hash
+chartImageCache = LRUCache(maxEntries = 1024, maxBytes = 64 * 1024 * 1024)
+
+# Markdown converters are reused, but they can't be shared between threads
+_markdownLocal = threading.local()
+
+def renderMarkdown(text: str, extensions: tuple = ()) -> str:
+    '''Converts markdown to html, reusing the result for text we've converted before'''
+    key = (tuple(extensions), text)
+    code = markdownCache.get(key)
+    if code is None:
+        # Get this thread's converter for the given extensions
+        converters = _markdownLocal.__dict__.setdefault('converters', {})
+        md = converters.get(key[0])
+        if md is None:
+            md = converters[key[0]] = markdown.Markdown(extensions = list(key[0]))
+
+        code = md.reset().convert(text)
+        markdownCache.put(key, code)
+
+    return code
+
+def scriptJSON(value) -> str:
+    '''Json for use inside a script block, where "</" could close the block early'''
+    return json.dumps(value, separators = (',', ':')).replace('</', '<\\/')
+
+# Styles used by compact reports in place of the repeated inline styles and line breaks
+COMPACT_STYLE = (
+    '<style>div.content.page{margin-left:0}div.page-hidden{display:none}'
+    '.dataframe-container,.vega-embed{margin-bottom:1em}</style>\n'
+)
+
+# Written in place of pages that were evicted by the memory governor, see governor.py
+EVICTED_PAGE = (
+    '<p><em>This page was removed from the report to save memory. '
+    'Open it again in the app to add it back.</em></p>'
+)
+
+# Output formats for compressed reports
+COMPRESSION = ('gzip', 'selfExtracting')
+
+# A page that unpacks a gzip compressed report in the browser
+SELF_EXTRACTING_OPEN = (
+    '<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"></head>\n<body>\n'
+    '<script type="application/octet-stream" id="report">'
+)
+SELF_EXTRACTING_CLOSE = '''</script>
+<script>
+// Decompress the report and replace this page with it
+(async function () {
+var data = atob(document.getElementById("report").textContent);
+var bytes = new Uint8Array(data.length);
+for (var i = 0; i < data.length; i++) {
+    bytes[i] = data.charCodeAt(i);
+}
+var stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("gzip"));
+var code = await new Response(stream).text();
+document.open();
+document.write(code);
+document.close();
+})();
+</script>
+</body>
+</html>
+'''
+
+@functools.lru_cache(maxsize = 1024)
+def minify(code: str) -> str:
+    '''Strips the indentation, blank lines and comment lines from template code
+    NOTE: Only used on the report's own templates, never on page content'''
+    lines = (line.strip() for line in code.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+def styleHeader(style: str) -> str:
+    '''Default header code around the given style code'''
+    # Starting code
+    head = '''
+        <!DOCTYPE html>
+        <!-- 
+            HTML code generated by streamlit_report
+            2024 Nick Xydis
+        -->
+        <html>
+        <head>
+        '''
+
+    # Write the style
+    return head + style
+
+def compactStyleHeader(style: str) -> str:
+    '''Compact header code around the given style code'''
+    return minify(styleHeader(style)) + '\n' + COMPACT_STYLE
+
+def chartParts(chart) -> tuple:
+    '''Converts an altair chart to the json of its spec, without the data, and the json
+    of each of its datasets by name'''
+    spec = chart.to_dict()
+    datasets = {name: scriptJSON(values) for name, values in spec.pop('datasets', {}).items()}
+    return scriptJSON(spec), datasets
+
+def chartImage(spec: str, datasets: dict, chartFormat: str = 'svg', scale: float = 2) -> str:
+    '''
+    Converts a chart to an inline svg or png image with vl-convert, reusing the image for
+    charts we've converted before.
+        spec, datasets: The chart's json, see chartParts
+        scale:          Pixels per unit of the chart's size, for png images
+    '''
+    if chartFormat not in CHART_FORMATS[1:]:
+        raise ValueError(f'Unknown image format {chartFormat!r}, expected one of {CHART_FORMATS[1:]}')
+
+    # NOTE: Datasets are named by a hash of their contents, so the spec and the names identify the chart
+    digest = hashlib.sha256('\n'.join([spec, *sorted(datasets)]).encode('utf-8')).hexdigest()
+    key = (chartFormat, scale if chartFormat == 'png' else None, digest)
+    code = chartImageCache.get(key)
+    if code is None:
+        vlc, version = assets.vegaConverter()
+        full = json.loads(spec)
+        if datasets:
+            full['datasets'] = {name: json.loads(values) for name, values in datasets.items()}
+
+        # Vectors are written into the page as they are
+        if chartFormat == 'svg':
+            code = vlc.vegalite_to_svg(full, vl_version = version)
+
+        # NOTE: vl-convert's png output is already deflate compressed
+        else:
+            png = vlc.vegalite_to_png(full, vl_version = version, scale = scale)
+            code = f'<img alt = "chart" src = "data:image/png;base64,{base64.b64encode(png).decode("ascii")}">'
+
+        chartImageCache.put(key, code)
+
+    return code
+
+def compressChunks(chunks, compression: str = 'gzip'):
+    '''Compresses the pieces of a report with gzip, see html.compressReport'''
+    if compression not in COMPRESSION:
+        raise ValueError(f'Unknown compression {compression!r}, expected one of {COMPRESSION}')
+
+    # NOTE: wbits = 31 writes a gzip header and trailer
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+
+    # Plain gzip output
+    if compression == 'gzip':
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode('utf-8'))
+            if data:
+                yield data
+        yield compressor.flush()
+        return
+
+    # Otherwise embed the gzip data as base64 in a page that unpacks it
+    # NOTE: Data is encoded in multiples of 3 bytes so the pieces join up
+    yield SELF_EXTRACTING_OPEN.encode('utf-8')
+    carry = b''
+    for chunk in chunks:
+        carry += compressor.compress(chunk.encode('utf-8'))
+        cut = len(carry) - len(carry) % 3
+        if cut:
+            yield base64.b64encode(carry[:cut])
+            carry = carry[cut:]
+    yield base64.b64encode(carry + compressor.flush())
+    yield SELF_EXTRACTING_CLOSE.encode('utf-8')
+
+def writeChunks(chunks, target, compression: str = None) -> None:
+    '''Writes the pieces of a report to a file path or writable file object, see html.writeReport'''
+    # Open paths ourselves
+    if isinstance(target, (str, os.PathLike)):
+        if compression:
+            with open(target, 'wb') as f:
+                return writeChunks(chunks, f, compression)
+        with open(target, 'w', encoding = 'utf-8', newline = '') as f:
+            return writeChunks(chunks, f)
+
+    # Text files get the code as is, anything else gets bytes
+    binary = not isinstance(target, io.TextIOBase) and 'b' in getattr(target, 'mode', 'b')
+
+    # Compressed reports are always bytes
+    if compression:
+        if not binary:
+            raise ValueError('Compressed reports must be written to a binary file')
+        for data in compressChunks(chunks, compression):
+            target.write(data)
+        return
+
+    for chunk in chunks:
+        target.write(chunk.encode('utf-8') if binary else chunk)
+
+class ReportSnapshot:
+    '''
+    The pieces of a report at one point in time. Spilled and shared pages are held as
+    read-only views, so the snapshot can be written on another thread while the pages
+    keep changing.
+    '''
+    __slots__ = ('pieces', 'size', 'key')
+
+    def __init__(self, pieces: list):
+        self.pieces = tuple(piece if isinstance(piece, str) else piece.view() for piece in pieces)
+        self.size = sum(len(piece) for piece in self.pieces)
+
+        # Equal for snapshots of the same content
+        self.key = tuple(piece if isinstance(piece, str) else piece.key for piece in self.pieces)
+
+    def chunks(self):
+        '''Yields the code of the report in pieces'''
+        for piece in self.pieces:
+            if isinstance(piece, str):
+                yield piece
+            else:
+                yield from piece.chunks()
 
 class html:
-    def __init__(self, styleFile: str = None):
+    def __init__(self, styleFile: str = None, memoryBudget: int = None):
         # Specify a style file to use
         self.styleFile = styleFile if styleFile else 'style.html'
 
+        # Page code is kept in memory up to the budget, then spilled to temporary files
+        self.store = PageStore(memoryBudget)
+
         # Note this code is static for all pages
-        self.head = self.header()
+        # NOTE: The head is read from the process-wide cache each time, see header()
         self.script = self.tabCode()
         self.report = None          # This will contain the code of the full report
+        self.reportKey = None       # Pieces the report was last assembled from
 
         # Note these fields will be unique to each page
-        self.body = {}              # Dictionary of body code for each page
-        self.sidebar = {}           # Dictionary for sidebar code
-        self.chartScript = {}       # Dictionary for chart scripts
-        self.pageNames = {}         # Names of each page associated with a page number
+        self.pages = PageRegistry() # Pages by number and by name, see pageRegistry.Page
+        self.body = PageContent(self.pages, 'body')                 # Body code buffers by page number
+        self.sidebar = PageContent(self.pages, 'sidebar')           # Sidebar code buffers
+        self.chartScript = PageContent(self.pages, 'chartScript')   # Chart script buffers
         self.pageOrder = []         # Order that the pages should be displayed in
-        
-        self.charts = 0             # Chart counter
+
         self.altairCharts = False   # Chart boolean
+        self.offline = False        # If true, the vega runtime is inlined instead of loaded from a CDN
+        self.vegaBundle = None      # Optional directory with the vega javascript files
+        self.chartFormat = 'interactive'    # How charts are written, see CHART_FORMATS
+        self.datasets = {}          # Chart data shared by every chart in the report, by dataset name
+        self.tablePages = set()     # Pages that have virtual tables on them
+        self.tableMode = 'static'   # How dataframes are written, see tables.TABLE_MODES
         self.side = False           # If true, writes to the sidebar
         self.lineBreak = True       # If true, puts a break between certain elements (charts, dataframes...)
+        self.compact = False        # If true, templates are minified and pages styled with classes
+        self.lazyPages = False      # If true, hidden pages are kept in templates and charts drawn as they're scrolled into view
+        self.markdownExtensions = ()    # Extensions used when converting markdown
+        self.deferred = False       # If true, elements are recorded and only rendered on export
+        self.shareFragments = False # If true, large fragments are shared with other sessions
+        self.workers = None         # Processes used to render deferred tables and charts, see parallel
+        self.running = False        # If true, a run of the app is still writing to the report, see governor
+        self.stats = ReportStats()  # Time and code size of each page and kind of element
+        self.element = None         # Kind of element being written, see measure
 
         # Tab and page counts
         self.page = 1               # The current page number
@@ -51,74 +302,113 @@ class html:
         # Init the body and sidebar sections
         self.clear()
 
+    @property
+    def pageNames(self) -> dict:
+        '''Page numbers by page name
+        NOTE: Read only, pages are named through self.pages'''
+        return self.pages.numbers
+
+    @property
+    def order(self) -> list:
+        '''Page order requested by the report, by page name'''
+        return self.pages.requested
+
+    @order.setter
+    def order(self, order: list) -> None:
+        self.pages.setOrder(order)
+
     def clear(self) -> None:
         '''Clears page code, including if the current page has been generated before'''
-        pageContent = [
-            self.body,
-            self.sidebar,
-            self.chartScript
-        ]
+        page = self.pages.page(self.page)
 
-        # Loop through each of the pages with content
-        for item in pageContent:
-            item[self.page] = ''
+        # Release the old code of the page
+        for buffer in page.buffers():
+            if buffer is not None:
+                self.store.release(buffer)
+        page.body, page.sidebar, page.chartScript = self.store.buffer(), self.store.buffer(), self.store.buffer()
 
         # Reset trigger variables
         self.altairCharts = False
+        self.tablePages.discard(self.page)
+        page.ops = []
+        page.datasets = set()
+        self.pruneDatasets()
+
+        # Element ids are numbered per page, so a page that is run again gets the same code
+        page.charts = 0
+        page.tables = 0
+        self.tabCount = 0
+        self.tabGroup = 0
+
+    def pruneDatasets(self) -> None:
+        '''Drops the chart data no page uses any more, releasing any shared copies of it'''
+        used = set().union(*(page.datasets for page in self.pages))
+        for name in [name for name in self.datasets if name not in used]:
+            data = self.datasets.pop(name)
+            if not isinstance(data, str):
+                data.release()
+
+    def close(self) -> None:
+        '''Releases the page code, including any temporary files it was spilled to'''
+        self.store.close()
+
+    def retainedMemory(self) -> int:
+        '''Characters of code held in memory by the report'''
+        report = self.report
+        return self.store.memory + (len(report) if report is not None else 0)
+
+    def releaseMemory(self, evict: bool = False) -> int:
+        '''
+        Frees the report's memory and returns the characters freed. The assembled report is
+        dropped and built again when it's next needed. The pages are spilled to temporary
+        files, or evicted if evict is True.
+        NOTE: Evicted pages are replaced with a note until the page is run again
+        '''
+        freed = self.retainedMemory() - self.store.memory
+        self.report = None
+        self.reportKey = None
+
+        with self.store.lock:
+            if evict:
+                freed += self.evict()
+            else:
+                freed += self.store.spill(0)
+        return freed
+
+    def evict(self) -> int:
+        '''Drops the code of every page, leaving a note in its place, and returns the
+        characters freed'''
+        freed = 0
+        for page in self.pages:
+            if page.body is None:
+                continue
+            freed += self.store.evict(page.sidebar)
+            freed += self.store.evict(page.chartScript)
+            freed += self.store.evict(page.body, EVICTED_PAGE)
+        return freed
 
     def increment(self, allowDuplicates : 'bool' = False) -> None:
         '''Increments the page or goes to the given page and clears its content'''
-        # If we're allowing duplicates or have a new page...
-        if allowDuplicates == True or self.pageName not in self.pageNames:
-            self.page = len(self.pageNames) + 1
-            self.pageNames[self.pageName] = self.page
-        
-        # Otherwise, the tab already exists and needs to be overwritten
-        elif allowDuplicates == False:
-            # Navigate to this page
-            self.page = self.pageNames[self.pageName]
-
-        # Make sure the page is an int
-        self.page = int(self.page)
+        # New pages and duplicates get a new page number, otherwise the page is overwritten
+        self.page = self.pages.visit(self.pageName, allowDuplicates == True).number
         
         # Clear and/or initialize the page
         self.clear()
 
-    def header(self) -> str:
-        '''Default header code'''
-        # Starting code
-        head = '''
-        <!DOCTYPE html>
-        <!-- 
-            HTML code generated by streamlit_report
-            2024 Nick Xydis
-        -->
-        <html>
-        <head>
-        '''
-        
-        # Read in the style html and add to our head code
-        text = ''
+    @property
+    def head(self) -> str:
+        '''Header code, including the style file'''
+        return self.header()
 
-        # Try to read from the dashboard directory first
-        try:
-            with open(self.styleFile) as f:
-                for line in f.readlines():
-                    text += line
-        
-        # Otherwise read from the default file
-        except:
-            text = ''
-            # Get the directory of this module
-            dirpath = os.path.dirname(__file__)
-            with open(os.path.join(dirpath, self.styleFile)) as f:
-                for line in f.readlines():
-                    text += line
-
-        # Write the style
-        head += text
+    def header(self) -> str:
+        '''Default header code
+        NOTE: The style file is read once per process and shared by every session. It's
+              read again if it changes on disk.'''
+        return assets.readFile(self.styleFile, compactStyleHeader if self.compact else styleHeader)
 
-        return head
+    def template(self, code: str) -> str:
+        '''Returns the template code, minified if the report is compact'''
+        return minify(code) if self.compact else code
 
     def tabCode(self) -> str:
         '''Writes the tab javascript code for tab navigation'''
@@ -129,7 +419,7 @@ class html:
         var i, x, tablinks;
 
         // Clear previous tab contents
-        x = document.getElementsByClassName("group_" + group + "_tablink");
+        x = document.getElementsByClassName("page_" + page + "_group_" + group + "_tabcontent");
         for (i = 0; i < x.length; i++) {
             x[i].style.display = "none";
         }
@@ -205,10 +495,184 @@ class html:
         '''
         return code
 
+    def tableCode(self) -> str:
+        '''Writes the javascript that draws the visible rows of virtual tables'''
+        code = '''
+        <script>
+        // Draw the rows of a virtual table that are scrolled into view
+        function drawTable(container) {
+        var table = container.reportTable;
+        var height = container.clientHeight || 400;
+        var first = Math.max(0, Math.floor(container.scrollTop / table.rowHeight) - 10);
+        var last = Math.min(table.rows, first + Math.ceil(height / table.rowHeight) + 20);
+
+        // Nothing to do if the same rows are already drawn
+        if (first == table.first && last == table.last) {
+            return;
+        }
+        table.first = first;
+        table.last = last;
+
+        // Build the visible rows between two spacers that keep the scroll height
+        var body = document.createElement("tbody");
+        body.appendChild(tableSpacer(first * table.rowHeight, table.data.length));
+        for (var r = first; r < last; r++) {
+            var row = document.createElement("tr");
+            for (var c = 0; c < table.data.length; c++) {
+                var cell = document.createElement("td");
+                cell.textContent = table.data[c][r];
+                row.appendChild(cell);
+            }
+            body.appendChild(row);
+        }
+        body.appendChild(tableSpacer((table.rows - last) * table.rowHeight, table.data.length));
+        table.element.replaceChild(body, table.element.tBodies[0]);
+
+        // Measure the real row height once the table is visible
+        var measured = body.rows.length > 2 ? body.rows[1].offsetHeight : 0;
+        if (measured && measured != table.rowHeight) {
+            table.rowHeight = measured;
+            table.first = -1;
+            drawTable(container);
+        }
+        }
+
+        function tableSpacer(height, columns) {
+        var row = document.createElement("tr");
+        var cell = document.createElement("td");
+        cell.colSpan = columns;
+        cell.style.height = height + "px";
+        cell.style.padding = "0";
+        cell.style.border = "0";
+        row.appendChild(cell);
+        return row;
+        }
+
+        // Load the embedded data for each virtual table under root and draw the first rows
+        function loadTables(root) {
+        var virtualTables = root.getElementsByClassName("virtual-table");
+        for (var t = 0; t < virtualTables.length; t++) {
+            var container = virtualTables[t];
+            if (container.reportTable) {
+                continue;
+            }
+            var data = JSON.parse(document.getElementById(container.id + "_data").textContent);
+            container.reportTable = {
+                element: container.getElementsByTagName("table")[0],
+                data: data.data,
+                rows: data.rows,
+                rowHeight: 24,
+                first: -1,
+                last: -1
+            };
+            container.addEventListener("scroll", function (evt) {
+                var target = evt.currentTarget;
+                if (!target.pending) {
+                    target.pending = true;
+                    window.requestAnimationFrame(function () {
+                        target.pending = false;
+                        drawTable(target);
+                    });
+                }
+            });
+            drawTable(container);
+        }
+        }
+        loadTables(document);
+        </script>
+        '''
+        return code
+
+    def lazyChartCode(self) -> str:
+        '''Writes the javascript that embeds charts when they're scrolled into view, for
+        reports with lazyPages. Goes before the chart scripts.'''
+        code = '''
+        <script type="text/javascript">
+        // Charts are kept here until they're scrolled into view
+        var lazyCharts = {};
+        var embedChart = vegaEmbed;
+        var chartSpec = (typeof reportSpec === "function") ? reportSpec : function (spec) { return spec; };
+        var chartObserver = ("IntersectionObserver" in window) ? new IntersectionObserver(function (entries) {
+            for (var e = 0; e < entries.length; e++) {
+                if (entries[e].isIntersecting) {
+                    chartObserver.unobserve(entries[e].target);
+                    drawChart(entries[e].target.id);
+                }
+            }
+        }, {rootMargin: "200px"}) : null;
+
+        function drawChart(id) {
+        var chart = lazyCharts[id];
+        if (chart) {
+            delete lazyCharts[id];
+            embedChart("#" + id, chartSpec(chart[0], chart[1])).catch(console.error);
+        }
+        }
+
+        // Watch a chart once its page is in the document
+        function watchChart(id) {
+        var element = document.getElementById(id);
+        if (element && !element.reportWatched) {
+            element.reportWatched = true;
+            if (chartObserver) {
+                chartObserver.observe(element);
+            } else {
+                drawChart(id);
+            }
+        }
+        }
+
+        function watchCharts() {
+        for (var id in lazyCharts) {
+            watchChart(id);
+        }
+        }
+
+        // The chart scripts register their charts instead of drawing them
+        reportSpec = function (spec, names) { return [spec, names]; };
+        vegaEmbed = function (selector, chart) {
+            lazyCharts[selector.slice(1)] = chart;
+            watchChart(selector.slice(1));
+            return Promise.resolve();
+        };
+        </script>
+        '''
+        return code
+
+    def lazyPageCode(self) -> str:
+        '''Writes the javascript that turns a page's template into content the first time
+        the page is opened, for reports with lazyPages. Goes after the tab script.'''
+        code = '''
+        <script type="text/javascript">
+        // Pages that aren't shown are kept in templates until they're first opened
+        function hydratePage(id) {
+        var element = document.getElementById(id);
+        var template = element ? element.querySelector("template.lazy-page") : null;
+        if (template) {
+            element.replaceChild(document.importNode(template.content, true), template);
+            if (typeof loadTables === "function") {
+                loadTables(element);
+            }
+            if (typeof watchCharts === "function") {
+                watchCharts();
+            }
+        }
+        }
+
+        var showPage = openPage;
+        openPage = function (evt, page_id) {
+            hydratePage(page_id);
+            hydratePage(page_id + "_sidebar");
+            showPage(evt, page_id);
+        };
+        </script>
+        '''
+        return code
+
     def tabBar(self, items: 'list'):
         '''Creates a tab bar with buttons for each item in the list'''
         # Open the div element
-        self.html(f'<div class = "tab">\n')
+        self.html(self.template(f'<div class = "tab">\n'))
 
         # Increment the tab group
         self.tabGroup += 1
@@ -223,10 +687,10 @@ class html:
                 {item}
             </button>
             '''
-            self.html(code)
+            self.html(self.template(code))
 
         # Close the element
-        self.html('</div>\n')
+        self.html(self.template('</div>\n'))
 
     def pageTabs(self) -> str:
         '''Adds the pages to the sidebar in the order generated or in an order specified
@@ -234,35 +698,10 @@ class html:
         NOTE: This code is similar but functionally different to the tabBar function'''
         # Initialize
         code = ''
-        order = self.order
 
-        # Increment the tab group
-        self.tabGroup += 1
-
-        # Determine the order to create the tabs
-        self.pageOrder = []
-
-        # Start with the provided order
-        if order:
-            for item in order:
-                # Only add the item to our page tabs if it exists in our data
-                if item in self.pageNames:
-                    self.pageOrder.append(item)
-
-        # Add any remaining tabs in the order they were generated
-        for item in self.pageNames:
-            if item not in self.pageOrder:
-                self.pageOrder.append(item)
-        
-        # Remove pages that don't have content
-        for item in self.body:
-            # Get the name of the page if we have multiple pages
-            name = self.getPageName(item)
-
-            # Check the page contents aren't blank
-            # If they are, remove the page from the list
-            if self.body[item] == '' and name in self.pageOrder:
-                self.pageOrder.remove(name)
+        # Start with the provided order, then the order the pages were generated in,
+        # leaving out pages that don't have content
+        self.pageOrder = self.pages.order()
 
         # If we only have one page left, return an empty string
         if len(self.pageOrder) <= 1:
@@ -271,7 +710,6 @@ class html:
 
         # Add a tab for each page
         for item in self.pageOrder:
-            self.tabCount += 1
             code += f'''
             <a href = "#{item}" class = "page_link" 
             onclick = 'openPage( event, "{item}_{self.pageNames[item]}")'>
@@ -285,13 +723,17 @@ class html:
             
     def altairHeader(self) -> str:
         '''Optional code to add to the header if we're using altair charts'''
+        # Offline reports carry their own copy of the vega runtime
+        if self.offline:
+            return assets.vegaRuntime(self.vegaBundle)
+
         import altair as alt
 
         altairChartStyle = '''
             <script src="https://cdn.jsdelivr.net/npm/vega@{vega_version}"></script>
             <script src="https://cdn.jsdelivr.net/npm/vega-lite@{vegalite_version}"></script>
             <script src="https://cdn.jsdelivr.net/npm/vega-embed@{vegaembed_version}"></script>
-        </head>'''
+        '''
 
         # Update the chart information
         altairChartStyle = altairChartStyle.format(
@@ -303,19 +745,139 @@ class html:
         # Return the code
         return altairChartStyle
     
+    def record(self, kind: str, *args) -> None:
+        '''Records an element to be rendered when the report is exported'''
+        self.pages[self.page].ops.append((kind, args, self.side, self.element))
+
+    def limitRecorded(self, pages: list) -> None:
+        '''Applies the row policies of the dataframes recorded on the given pages, see dataframe'''
+        for page in pages:
+            ops = self.pages[page].ops
+            for i, (kind, args, side, element) in enumerate(ops):
+                if kind != 'dataframe':
+                    continue
+                df, height, width, mode, note, maxRows, rowPolicy, seed = args
+                df, limited = tables.limitRows(df, maxRows, rowPolicy, seed)
+                ops[i] = (kind, (df, height, width, mode, limited or note), side, element)
+
+    def pageSize(self) -> int:
+        '''Characters of code on the current page'''
+        return self.pages[self.page].size()
+
+    @contextmanager
+    def measure(self, kind: str, count: int = 1):
+        '''Adds the time taken and the code written by the block to the stats
+            kind:   Kind of element, e.g. 'dataframe' or 'selectbox'
+            count:  0 if the element was already counted'''
+        outer, self.element = self.element, kind
+        page, before = self.page, self.pageSize()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.element = outer
+            self.stats.add(page, kind, time.perf_counter() - start, self.pageSize() - before, count)
+
+    def statsSummary(self) -> dict:
+        '''
+        Totals for each page and kind of element, the time taken to assemble the report,
+        and the code retained by each page
+        NOTE: Sizes are in characters of html code
+        '''
+        names = {page.number: page.name for page in self.pages if page.name is not None}
+        summary = self.stats.summary(names)
+
+        # Code held by each page, in memory and in temporary files
+        retained = {}
+        for page in self.pages:
+            retained[names.get(page.number, page.number)] = {
+                'bytes':    page.size(),
+                'memory':   sum(buffer.memory for buffer in page.buffers()),
+            }
+
+        summary['retained'] = {
+            'pages':    retained,
+            'bytes':    sum(page['bytes'] for page in retained.values()),
+            'memory':   self.store.memory,
+            'report':   len(self.report) if self.report is not None else 0,
+            'datasets': sum(len(data) for data in self.datasets.values()),
+        }
+        return summary
+
+    def render(self) -> None:
+        '''Renders the elements recorded in deferred mode into the page code'''
+        pending = [page.number for page in self.pages if page.ops]
+        if not pending:
+            return
+
+        # Only the rows written to the report are rendered
+        self.limitRecorded(pending)
+
+        # Heavy elements can be rendered by a pool of processes first
+        rendered = {}
+        if self.workers:
+            from streamlit_report import parallel
+            rendered = parallel.renderElements(self, pending)
+
+        # Save the current state, rendering moves between pages and sidebars
+        state = (self.page, self.side, self.deferred)
+        self.deferred = False
+        try:
+            for page in pending:
+                self.page = page
+
+                # The chart script is already open if the page has charts on it
+                self.altairCharts = bool(self.chartScript[page])
+
+                # Replay each element in the order it was written
+                ops, self.pages[page].ops = self.pages[page].ops, []
+                for i, (kind, args, side, element) in enumerate(ops):
+                    self.side = side
+                    # NOTE: Elements written through the report were counted when recorded
+                    with self.measure(element or kind, count = 0 if element else 1):
+                        if (page, i) in rendered:
+                            getattr(self, kind)(*args, rendered = rendered[(page, i)])
+                        else:
+                            getattr(self, kind)(*args)
+
+        # Restore the state
+        finally:
+            self.page, self.side, self.deferred = state
+            self.altairCharts = bool(self.chartScript[self.page])
+
     def write(self, text):
         '''HTML for the write command'''
+        # Defer the markdown conversion until the report is exported
+        if self.deferred:
+            return self.record('write', text)
+
         # Generate the markdown code
-        code = markdown.markdown(text)
+        # NOTE: Conversions are cached, widgets write the same text on every rerun
+        code = renderMarkdown(text, self.markdownExtensions)
         
         # Write the code
         self.html(code)
 
-    def altairChart(self, chart):
-        '''HTML to display an altair chart'''
-        # Increment our global count by one
-        self.charts += 1
-        chartNumber = self.charts
+    def altairChart(self, chart, rendered = None):
+        '''HTML to display an altair chart
+            rendered:   The chart's json if it was already made, see chartParts, or its
+                        image for reports with a static chartFormat, see chartImage'''
+        # Defer the chart json until the report is exported
+        if self.deferred:
+            return self.record('altairChart', chart)
+
+        # Increment the page's count by one
+        page = self.pages[self.page]
+        page.charts += 1
+        chartNumber = f'{self.page}_{page.charts}'
+
+        # Charts converted to images don't need the vega runtime
+        if self.chartFormat != 'interactive':
+            image = rendered if rendered is not None else chartImage(*chartParts(chart), self.chartFormat)
+            self.html(f'<div id="vis{chartNumber}" class="chart-image">\n')
+            self.html(image)
+            self.html('\n</div>\n' + (" \n <br> \n" if self.lineBreak else ''))
+            return
 
         # Chart code
         chartCode = f'''<div id="vis{chartNumber}"></div>\n'''
@@ -332,11 +894,31 @@ class html:
             self.chartScript[self.page] += '''<script type="text/javascript">\n'''
             self.altairCharts = True
         
+        # Move the chart's data to the report's datasets, so charts drawn from the same
+        # data only embed it once. Datasets are named by a hash of their contents.
+        spec, datasets = rendered or chartParts(chart)
+        names = []
+        for name, values in datasets.items():
+            if name not in self.datasets:
+                self.datasets[name] = self.share(values)
+            page.datasets.add(name)
+            names.append(name)
+
         # Append to the chart script
-        self.chartScript[self.page] += f'''vegaEmbed('#vis{chartNumber}', {chart.to_json(indent = None)}).catch(console.error);\n'''
+        # NOTE: The spec is added on its own so it can be shared with other sessions
+        self.chartScript[self.page] += f'''vegaEmbed('#vis{chartNumber}', reportSpec('''
+        self.chartScript[self.page] += self.share(spec)
+        self.chartScript[self.page] += f''', {json.dumps(names)})).catch(console.error);\n'''
 
     def html(self, code):
         '''Adds the code to the body or sidebar'''
+        # Keep the code in order with the deferred elements
+        if self.deferred:
+            return self.record('html', code)
+
+        # Large fragments may be shared with other sessions
+        code = self.share(code)
+
         # Write to the sidebar
         if self.side:
             self.sidebar[self.page] += code
@@ -345,14 +927,53 @@ class html:
         else:
             self.body[self.page] += code
 
-    def dataframe(self, df, height = '400px', width = '60%'):
-        '''Writes the html code needed for a dataframe'''
-        # If we have a polars dataframe, convert to pandas
-        if type(df) == pl.DataFrame:
-            df = df.to_pandas()
+    def share(self, code: str):
+        '''Returns the shared copy of the code if sharing is on, otherwise the code'''
+        if self.shareFragments:
+            return fragmentStore.share(code)
+        return code
+
+    def dataframe(
+            self, df, height = '400px', width = '60%', mode: str = None, note: str = None,
+            maxRows: int = None, rowPolicy: str = 'head', seed: int = 0, rendered: str = None,
+        ):
+        '''Writes the html code needed for a dataframe
+            mode:       'static', 'virtual' or 'auto', defaults to the report's tableMode
+            note:       Text shown under the table, e.g. which rows were left out, see tables.limitRows
+            maxRows, rowPolicy, seed:   How large dataframes are shortened, see tables.limitRows
+            rendered:   The table code, or virtual table data, if it was already made'''
+        # Defer the table until the report is exported
+        # NOTE: The row policy is applied when the report is built too, see limitRecorded
+        if self.deferred:
+            if rowPolicy not in tables.ROW_POLICIES:
+                raise ValueError(f'Unknown row policy {rowPolicy!r}, expected one of {tables.ROW_POLICIES}')
+            return self.record('dataframe', df, height, width, mode, note, maxRows, rowPolicy, seed)
+
+        # Shorten large dataframes
+        df, limited = tables.limitRows(df, maxRows, rowPolicy, seed)
+        note = limited or note
+
+        # Large tables can be embedded as data and drawn as they're scrolled
+        if tables.useVirtual(df, mode or self.tableMode):
+            page = self.pages[self.page]
+            page.tables += 1
+            self.tablePages.add(self.page)
+            # NOTE: The table is written in pieces so its data can be shared
+            for code in tables.virtualTable(df, f'table{self.page}_{page.tables}', rendered):
+                self.html(code)
+
+            # Say what was left out of the table
+            if note:
+                self.html(tables.tableNote(note))
+
+            # Line break
+            if self.lineBreak:
+                self.html("<br>")
+            return
 
         # Create the html code for the table
-        table = df.to_html(index = False)
+        # NOTE: Polars dataframes are rendered directly, without converting to pandas
+        table = rendered if rendered is not None else tables.renderTable(df)
 
         # Create an iframe around the table
         # Version 0.0.7 -- Change style definition to style.
@@ -361,6 +982,10 @@ class html:
         </div>
         '''
 
+        # Say what was left out of the table
+        if note:
+            code += tables.tableNote(note)
+
         # Line break
         if self.lineBreak:
             code += "<br>"
@@ -370,91 +995,242 @@ class html:
 
     def getPageName(self, number: int) -> str:
         '''For the given page number, returns the page name'''
-        # Default value is None
-        n = None
-        
-        # Loop through all the pages we collected data for
-        for key, value in self.pageNames.items():
-            if value == number:
-                n = key
+        return self.pages.nameOf(number)
+
+    def pageFragments(self, item: int) -> tuple:
+        '''Returns the sidebar, body and chart script pieces for a page
+        NOTE: Pieces are reused from the last assembly if the page hasn't changed'''
+        # Get the name of the page if we have multiple pages
+        page = self.pages[item]
+        name = self.pages.nameOf(item)
+        first = name == self.pageOrder[0] if len(self.pageOrder) > 0 else None
+        sidebar, body, chartScript = page.sidebar, page.body, page.chartScript
+
+        # Check if the page is the same as last time
+        fingerprint = (name, first, self.compact, self.lazyPages, sidebar.fingerprint(), body.fingerprint(), chartScript.fingerprint())
+        cached = page.fragments
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+
+        # Pages that aren't shown first are kept in templates until they're opened
+        lazy = self.lazyPages and first is False
+
+        # NOTE: In-memory content is added as a string, spilled or shared content as its buffer
+        content = lambda buffer: buffer.piece()
+
+        # Sidebar block
+        barID = f'id = "{name}_{item}_sidebar"' if name else ''
+        display = ''
+        if first is not None and self.compact:
+            display = '' if first else 'page-hidden'
+        elif first is not None:
+            display = 'style = "display: block"' if first else 'style = "display: none"'
+
+        if self.compact:
+            sidebarOpen = f'<div class="sidebar {display}" {barID}>'
+        else:
+            sidebarOpen = f'<div class = "sidebar" {barID} {display}>\n'
+        if lazy:
+            sidebarOpen += '<template class="lazy-page">'
+        sidebarPieces = (sidebarOpen, content(sidebar), ('</template>' if lazy else '') + self.template('\n</div>'))
+
+        # Content block
+        id = f'id = "{name}_{item}"' if name else ''
+        display = ''
+        if first is not None and self.compact:
+            display = 'page' if first else 'page page-hidden'
+        elif first is not None:
+            display = 'style = "margin-left: 0;' + ('display: block"' if first else 'display: none"')
+
+        if self.compact:
+            bodyOpen = f'\n<div class="content {display}" {id}>\n'
+        else:
+            bodyOpen = f'''
+            <div class = "content" {id} {display}> 
+                '''
+        if lazy:
+            bodyOpen += '<template class="lazy-page">'
+        bodyPieces = (bodyOpen, content(body), ('</template>' if lazy else '') + self.template('''
+            </div>'''))
+
+        # Chart script, if there is one
+        chartPieces = ()
+        if chartScript:
+            chartPieces = (self.template('''
+                    '''), content(chartScript), self.template('''
+                </script>'''))
+
+        pieces = (sidebarPieces, bodyPieces, chartPieces)
+        page.fragments = (fingerprint, pieces)
+        return pieces
+
+    def datasetPieces(self, names: set = None) -> list:
+        '''Script pieces defining the datasets used by the report's charts, and the
+        reportSpec function the chart scripts call, if the report has charts
+            names:  Only define these datasets, e.g. the ones used by a single page
+        NOTE: Each chart gets its own copy of the rows, since vega adds ids to them'''
+        # Only keep the datasets that are still used by a page
+        self.pruneDatasets()
+        datasets = self.datasets if names is None else {
+            name: data for name, data in self.datasets.items() if name in names
+        }
+
+        # NOTE: Every chart calls reportSpec, even charts with inline or url data
+        if not datasets and not any(self.chartScript.values()):
+            return []
+
+        pieces = [self.template('''
+        <script type="text/javascript">
+        var reportDatasets = {''')]
+        # NOTE: Datasets are written in order of name, so the report doesn't depend on the
+        #       order pages were run in
+        for i, name in enumerate(sorted(datasets)):
+            # NOTE: Shared datasets are added as their text, which isn't copied
+            data = datasets[name]
+            pieces += [(',' if i else '') + json.dumps(name) + ':', str(data)]
+        pieces.append(self.template('''};
+
+        // Adds copies of the shared datasets to a chart spec
+        function reportSpec(spec, names) {
+        spec.datasets = {};
+        for (var d = 0; d < names.length; d++) {
+            spec.datasets[names[d]] = reportDatasets[names[d]].map(function (row) {
+                return (row !== null && typeof row === "object") ? Object.assign({}, row) : row;
+            });
+        }
+        return spec;
+        }
+        </script>'''))
+        return pieces
 
-        # Return the page name
-        return n
+    def reportPieces(self) -> list:
+        '''Returns the pieces of the full report in order. Pieces are either strings or
+        the buffers of spilled pages, which are read back when the report is written.'''
+        # Render anything that was recorded in deferred mode
+        self.render()
+
+        # Only add the altair scripts if a page has a chart
+        altairHead = ''
+        if any(self.chartScript.values()):
+            altairHead = self.altairHeader()
+
+        # NOTE: The head is left untouched so it doesn't grow each time the report is made
+        pieces = [self.head, altairHead, '\n</head>']
 
-    def generateReport(self) -> str:
         # Create the main body block
-        self.main = '''<body onload = "openNav()">
+        nav = '''<body onload = "openNav()">
         <div id = "pageNav" class = "sidenav">
         <a href="javascript:void(0)" class="closebtn" onclick="closeNav()">&times;</a>
         '''
 
         # If we have multiple pages, add their buttons to the sidebar
         if len(self.pageNames) > 1:
-            self.main += self.pageTabs()
+            nav += self.pageTabs()
+        pieces.append(self.template(nav))
+
+        # Get the code for each page, only pages that changed are assembled again
+        fragments = [self.pageFragments(page.number) for page in self.pages]
 
         # NOTE: Sidebar now is grouped with sidenav by default
-        for item in self.sidebar:
-            # Get the name of the page if we have multiple pages
-            name = self.getPageName(item)
-            barID = f'id = "{name}_{item}_sidebar"' if name else ''
-
-            display = ''
-            if len(self.pageOrder) > 0:
-                if name == self.pageOrder[0]:
-                    display += 'style = "display: block"'
-                else:
-                    display += 'style = "display: none"'
-            else:
-                display = ''
+        for sidebarPieces, _, _ in fragments:
+            pieces.extend(sidebarPieces)
 
-            # Add each item to the sidenav
-            self.main += f'<div class = "sidebar" {barID} {display}>\n'
+        # Close the sidenav block
+        pieces.append('</div>\n')
 
-            self.main += self.sidebar[item] + '\n'
-            self.main += '</div>'
+        for _, bodyPieces, _ in fragments:
+            pieces.extend(bodyPieces)
+
+        # Add the chart datasets and the chartScript if there is some
+        pieces.extend(self.datasetPieces())
+        if self.lazyPages and any(chartPieces for _, _, chartPieces in fragments):
+            pieces.append(self.template(self.lazyChartCode()))
+        for _, _, chartPieces in fragments:
+            pieces.extend(chartPieces)
 
-        # Close the sidenav block
-        self.main += '</div>\n'
-
-        for item in self.body:
-            # Get the name of the page if we have multiple pages
-            name = self.getPageName(item)
-            id = f'id = "{name}_{item}"' if name else ''
-
-            display = 'style = "margin-left: 0;'
-            if len(self.pageOrder) > 0:
-                if name == self.pageOrder[0]:
-                    display += 'display: block"'
-                else:
-                    display += 'display: none"'
-            else:
-                display = ''
-            
-            self.main += f'''
-            <div class = "content" {id} {display}> 
-                {self.body[item]}
-            </div>'''
-        
-        # Add the chartScript if there is some
-        first = True
-        altairHead = ''
-        for item in self.chartScript:
-            # Check that there's altair code to add
-            if self.chartScript[item] != '':
-                # If it's the first time, add to our altair header
-                if first:
-                    altairHead = self.altairHeader()
-                    first = False
-                
-                # Add the altair script code
-                self.main += f'''
-                    {self.chartScript[item]}
-                </script>'''
-        
         # Close the code block
-        self.head += altairHead + '\n</head>'
-        self.main += "</body>\n"
-        self.report = self.head + self.main + self.script + '</html>'
+        pieces.append("</body>\n")
+        pieces.append(self.template(self.script))
+
+        # Add the virtual table script if any page uses it
+        if self.tablePages:
+            pieces.append(self.template(self.tableCode()))
+
+        # Fill in lazy pages as they're opened
+        if self.lazyPages:
+            pieces.append(self.template(self.lazyPageCode()))
+        pieces.append('</html>')
+
+        return pieces
+
+    def iterReport(self):
+        '''Yields the code of the full report in pieces: the head, the page navigation,
+        each sidebar, each page, the chart scripts and finally the tab script'''
+        for piece in self.reportPieces():
+            if isinstance(piece, str):
+                yield piece
+            else:
+                yield from piece.chunks()
+
+    def snapshot(self) -> 'ReportSnapshot':
+        '''Returns an immutable copy of the report's pieces that can be written from
+        another thread while the app keeps running'''
+        return ReportSnapshot(self.reportPieces())
+
+    def compressReport(self, compression: str = 'gzip'):
+        '''
+        Yields the report compressed with gzip, without building the full report in memory
+            compression:    'gzip' for a .html.gz file, or 'selfExtracting' for an html
+                            page that decompresses itself in the browser
+        '''
+        return compressChunks(self.iterReport(), compression)
+
+    def writeReport(self, target, compression: str = None) -> None:
+        '''Writes the report to a file path or a writable file object without
+        building the full report in memory. Binary targets receive utf-8 bytes.
+            compression:    Optional 'gzip' or 'selfExtracting', see compressReport'''
+        size = 0
+        def chunks():
+            nonlocal size
+            for chunk in self.iterReport():
+                size += len(chunk)
+                yield chunk
+
+        start = time.perf_counter()
+        writeChunks(chunks(), target, compression)
+        self.stats.assembled('write', time.perf_counter() - start, size)
+
+    def writeDirectory(self, directory: str) -> dict:
+        '''Writes the report to a directory with a file per page, rewriting only the pages
+        that changed since the last export to it, see directoryExport
+        Returns the files written, left unchanged and removed'''
+        from streamlit_report import directoryExport
+        return directoryExport.exportDirectory(self, directory)
+
+    def saveSnapshot(self, target) -> dict:
+        '''Saves the report's pages to a compressed snapshot file, see snapshotFile'''
+        from streamlit_report import snapshotFile
+        return snapshotFile.save(self, target)
+
+    def restoreSnapshot(self, source) -> dict:
+        '''Replaces the report's pages with those of a snapshot file, see snapshotFile'''
+        from streamlit_report import snapshotFile
+        return snapshotFile.restore(self, source)
+
+    def generateReport(self) -> str:
+        '''Assembles the code for every page into the full report
+        NOTE: The pieces are joined once at the end, and not at all if none of them changed'''
+        start = time.perf_counter()
+        pieces = self.reportPieces()
+
+        # Spilled pages are identified by their revision
+        key = [piece if isinstance(piece, str) else (piece, piece.revision) for piece in pieces]
+        if self.report is not None and key == self.reportKey:
+            return self.report
+
+        self.report = ''.join(piece if isinstance(piece, str) else piece.getvalue() for piece in pieces)
+        self.reportKey = key
+        self.stats.assembled('generate', time.perf_counter() - start, len(self.report))
 
         # Return the report
-        return self.report
\ No newline at end of file
+        return self.report
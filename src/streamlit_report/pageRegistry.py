@@ -0,0 +1,166 @@
+'''
+   Copyright 2024 Nick Xydis
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Purpose: Keep track of the pages of a report by number and by name.
+'''
+
+class Page:
+    '''The code and state of one page of a report'''
+    __slots__ = ('number', 'name', 'body', 'sidebar', 'chartScript', 'ops', 'datasets', 'charts', 'tables', 'fragments')
+
+    def __init__(self, number: int, name: str = None):
+        self.number = number
+        self.name = name            # Newest name given to the page
+        self.body = None            # Body code buffer, see pageStore.PageBuffer
+        self.sidebar = None         # Sidebar code buffer
+        self.chartScript = None     # Chart script buffer
+        self.ops = []               # Recorded elements, for deferred reports
+        self.datasets = set()       # Names of the chart datasets used by the page
+        self.charts = 0             # Chart counter
+        self.tables = 0             # Virtual table counter
+        self.fragments = None       # Assembled code along with its fingerprint
+
+    def buffers(self) -> tuple:
+        '''The page's code buffers'''
+        return (self.body, self.sidebar, self.chartScript)
+
+    def size(self) -> int:
+        '''Characters of code on the page'''
+        return len(self.body) + len(self.sidebar) + len(self.chartScript)
+
+class PageRegistry:
+    '''
+    The pages of a report, indexed by number and by name, along with the order they're
+    shown in.
+    NOTE: With duplicate pages a name refers to its newest page. Older pages keep their
+          code, but no longer have a name.
+    '''
+    def __init__(self):
+        self.pages = {}             # Page number -> Page, in the order they were added
+        self.numbers = {}           # Page name -> page number
+        self.requested = None       # Order requested by the report, by page name
+        self.named = None           # Names in the order they're shown, updated as pages change
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def __iter__(self):
+        return iter(self.pages.values())
+
+    def __contains__(self, number: int) -> bool:
+        return number in self.pages
+
+    def __getitem__(self, number: int) -> Page:
+        return self.pages[number]
+
+    def clear(self) -> None:
+        '''Removes every page'''
+        self.pages.clear()
+        self.numbers.clear()
+        self.requested = None
+        self.named = None
+
+    def page(self, number: int) -> Page:
+        '''Returns the page with the given number, adding it if it's new'''
+        page = self.pages.get(number)
+        if page is None:
+            page = self.pages[number] = Page(number)
+        return page
+
+    def visit(self, name: str, allowDuplicates: bool = False) -> Page:
+        '''Returns the page for the given name, adding a new one for new names or duplicates'''
+        if allowDuplicates or name not in self.numbers:
+            # NOTE: Numbered by the count of names, as pages have always been
+            page = self.page(len(self.numbers) + 1)
+            self.name(page, name)
+            return page
+
+        return self.pages[self.numbers[name]]
+
+    def name(self, page: Page, name: str) -> None:
+        '''Gives a page a name'''
+        if name not in self.numbers:
+            self.named = None
+        self.numbers[name] = page.number
+        page.name = name
+
+    def rename(self, old: str, new: str) -> None:
+        '''Changes the name of a page'''
+        number = self.numbers.pop(old)
+        self.numbers[new] = number
+        if self.pages[number].name == old:
+            self.pages[number].name = new
+        self.named = None
+
+    def nameOf(self, number: int) -> str:
+        '''Returns the name of the page with the given number, if it has one'''
+        page = self.pages.get(number)
+        if page is None or page.name is None or self.numbers.get(page.name) != number:
+            return None
+        return page.name
+
+    def setOrder(self, order: list) -> None:
+        '''Sets the order pages are shown in, by page name'''
+        if order != self.requested:
+            self.requested = list(order) if order else None
+            self.named = None
+
+    def order(self) -> list:
+        '''Names of the pages with content, in the requested order and then the order
+        they were added'''
+        # The full order only changes when pages are named or the requested order changes
+        if self.named is None:
+            named = dict.fromkeys(name for name in self.requested or () if name in self.numbers)
+            named.update(dict.fromkeys(self.numbers))
+            self.named = list(named)
+
+        # Leave out pages without content
+        return [name for name in self.named if self.pages[self.numbers[name]].body]
+
+class PageContent:
+    '''Read and write one code buffer of every page by page number, e.g. html.body[page]'''
+    __slots__ = ('registry', 'field')
+
+    def __init__(self, registry: PageRegistry, field: str):
+        self.registry = registry
+        self.field = field
+
+    def __getitem__(self, number: int):
+        return getattr(self.registry.pages[number], self.field)
+
+    def __setitem__(self, number: int, buffer) -> None:
+        setattr(self.registry.page(number), self.field, buffer)
+
+    def __contains__(self, number: int) -> bool:
+        return number in self.registry.pages
+
+    def __iter__(self):
+        return iter(self.registry.pages)
+
+    def __len__(self) -> int:
+        return len(self.registry.pages)
+
+    def get(self, number: int, default = None):
+        page = self.registry.pages.get(number)
+        return default if page is None else getattr(page, self.field)
+
+    def keys(self):
+        return self.registry.pages.keys()
+
+    def values(self):
+        return [getattr(page, self.field) for page in self.registry]
+
+    def items(self):
+        return [(page.number, getattr(page, self.field)) for page in self.registry]
@@ -0,0 +1,329 @@
+'''
+   Copyright 2024 Nick Xydis
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Purpose: Storage for the html code written to each page of a report.
+'''
+
+import codecs
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+
+# Size of the pieces read back from a spilled page
+CHUNK_SIZE = 1 << 20
+
+class PageBuffer:
+    '''
+    Append-only buffer of html fragments for one section of a page.
+    NOTE: Fragments are kept in a list and only joined when the page is assembled,
+          so writing to a page never copies the code that is already on it.
+    NOTE: Buffers created by a PageStore may have the start of their code spilled
+          to a temporary file, with newer fragments kept in memory after it.
+    NOTE: Fragments may be shared with other sessions (see cache.FragmentStore). These
+          are never joined into the buffer's own copy of the code.
+    '''
+    __slots__ = ('parts', 'size', 'store', 'path', 'onDisk', 'diskBytes', 'revision', 'shared', 'hash', '__weakref__')
+
+    def __init__(self, store: 'PageStore' = None):
+        self.parts = []             # Fragments in the order they were written
+        self.size = 0               # Number of characters held by the buffer
+        self.store = store          # Store that accounts for this buffer's memory
+        self.path = None            # Temporary file holding the spilled code
+        self.onDisk = 0             # Number of characters in the temporary file
+        self.diskBytes = 0          # Number of bytes in the temporary file
+        self.revision = 0           # Number of fragments written, used to detect changes
+        self.shared = 0             # Number of shared fragments in the buffer
+        self.hash = None            # Hash of the content, only kept once the buffer is streamed
+
+    @property
+    def memory(self) -> int:
+        '''Number of characters held in memory'''
+        return self.size - self.onDisk
+
+    @property
+    def streamed(self) -> bool:
+        '''True if the buffer is read back in pieces instead of being joined'''
+        return self.path is not None or self.shared > 0
+
+    def append(self, code: str) -> None:
+        '''Adds a fragment, or a shared fragment, to the end of the buffer'''
+        # Skip empty fragments so they don't take up a slot
+        if not code:
+            return
+
+        # NOTE: The store's lock keeps the buffer consistent if it's spilled from another thread
+        if self.store is None:
+            return self.addPart(code)
+        with self.store.lock:
+            self.addPart(code)
+
+            # Let the store know, it may decide to spill us
+            self.store.written(self, len(code))
+
+    def addPart(self, code: str) -> None:
+        '''Adds a fragment to the parts, see append'''
+        if not isinstance(code, str):
+            self.startHash()
+            self.shared += 1
+        if self.hash is not None:
+            self.hashPart(code)
+        self.parts.append(code)
+        self.size += len(code)
+        self.revision += 1
+
+    def __iadd__(self, code: str) -> 'PageBuffer':
+        '''Allows the buffer to be written with +=, like the strings it replaces'''
+        self.append(code)
+        return self
+
+    def __len__(self) -> int:
+        return self.size
+
+    def getvalue(self) -> str:
+        '''Returns the buffer contents as a single string'''
+        # Spilled buffers have to be read back in, shared fragments can't be joined in place
+        if self.streamed:
+            return ''.join(self.chunks())
+
+        # Join once and keep the result so an unchanged page isn't joined again
+        if len(self.parts) > 1:
+            self.parts = [''.join(self.parts)]
+
+        return self.parts[0] if self.parts else ''
+
+    def fingerprint(self):
+        '''Value that changes whenever the buffer's content does
+        NOTE: In-memory buffers use their content, so a page that is rewritten with the
+              same code keeps the same fingerprint. Streamed buffers use their revision.'''
+        if self.streamed:
+            return (self, self.revision)
+        return self.getvalue()
+
+    def startHash(self) -> None:
+        '''Starts hashing the content, from the fragments that are still in memory
+        NOTE: Called before the buffer is first streamed, so nothing has been spilled yet'''
+        if self.hash is None:
+            self.hash = hashlib.blake2b(digest_size = 20)
+            for part in self.parts:
+                self.hashPart(part)
+
+    def hashPart(self, part) -> None:
+        '''Adds a fragment to the content hash. Shared fragments are already hashed.'''
+        if isinstance(part, str):
+            self.hash.update(part.encode('utf-8', 'surrogatepass'))
+        else:
+            self.hash.update(part.key)
+
+    def contentKey(self):
+        '''Value that is equal for buffers with the same content, even across page reruns.
+        Unlike fingerprint(), it doesn't identify the buffer itself.'''
+        if self.streamed:
+            return (self.size, self.hash.digest())
+        return self.getvalue()
+
+    def view(self) -> 'BufferView':
+        '''Returns a read-only view of the buffer as it is now'''
+        return BufferView(self)
+
+    def piece(self):
+        '''The buffer as a piece of the report: its content, or itself if it's streamed'''
+        return self if self.streamed else self.getvalue()
+
+    def chunks(self):
+        '''Yields the buffer contents in pieces without joining them'''
+        # Stream the spilled code back through a memory map
+        if self.path and self.onDisk:
+            yield from readSpilled(self.path, self.diskBytes)
+
+        # Then whatever is still in memory
+        if self.streamed:
+            for part in self.parts:
+                yield part if isinstance(part, str) else part.text
+        elif self.parts:
+            yield self.getvalue()
+
+    def spill(self, directory: str) -> int:
+        '''Moves the in-memory code to a temporary file and returns the characters freed'''
+        # Nothing to do for an empty buffer
+        freed = self.memory
+        if freed == 0:
+            return 0
+
+        # Create the file the first time we spill
+        if self.path is None:
+            self.startHash()
+            fd, self.path = tempfile.mkstemp(suffix = '.html', dir = directory)
+            os.close(fd)
+
+        # Add the in-memory code to the end of the file
+        with open(self.path, 'a', encoding = 'utf-8', newline = '') as f:
+            for part in self.parts:
+                f.write(part if isinstance(part, str) else part.text)
+            self.diskBytes = f.tell()
+        self.releaseShared()
+        self.parts = []
+        self.onDisk = self.size
+
+        return freed
+
+    def releaseShared(self) -> None:
+        '''Lets go of the shared fragments held by the buffer'''
+        if self.shared:
+            for part in self.parts:
+                if not isinstance(part, str):
+                    part.release()
+            self.shared = 0
+
+    def evict(self) -> int:
+        '''Drops the buffer's code, in memory and on disk, and returns the characters
+        freed from memory. The buffer can still be written to afterwards.'''
+        freed = self.memory
+        self.discard()
+        self.parts = []
+        self.size = 0
+        self.onDisk = 0
+        self.diskBytes = 0
+        self.hash = None
+        self.revision += 1
+        return freed
+
+    def discard(self) -> None:
+        '''Removes the buffer's temporary file and lets go of its shared fragments'''
+        self.releaseShared()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+    def __str__(self) -> str:
+        return self.getvalue()
+
+def readSpilled(path: str, size: int):
+    '''Yields the first size bytes of a spilled page as text, through a memory map'''
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as m:
+        for start in range(0, size, CHUNK_SIZE):
+            yield decoder.decode(m[start:min(start + CHUNK_SIZE, size)])
+    yield decoder.decode(b'', final = True)
+
+class BufferView:
+    '''
+    Read-only view of a page buffer at one point in time, for reading it from another thread.
+    NOTE: Code written to the buffer later, including code spilled after the view was
+          taken, is not part of the view. Shared fragments are immutable.
+    NOTE: A view can't be read once its page is cleared, since the spilled file is removed.
+    '''
+    __slots__ = ('parts', 'size', 'path', 'diskBytes', 'key')
+
+    def __init__(self, buffer: PageBuffer):
+        self.parts = tuple(buffer.parts)
+        self.size = buffer.size
+        self.path = buffer.path
+        self.diskBytes = buffer.diskBytes
+        self.key = buffer.contentKey()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def chunks(self):
+        '''Yields the viewed contents in pieces'''
+        if self.path and self.diskBytes:
+            yield from readSpilled(self.path, self.diskBytes)
+        for part in self.parts:
+            yield part if isinstance(part, str) else part.text
+
+class PageStore:
+    '''
+    Creates the page buffers for a report and keeps the code they hold in memory
+    under a budget. Once the budget is exceeded, the largest buffers are spilled to
+    a temporary directory for the session.
+        memoryBudget:   Approximate number of bytes of page code to keep in memory.
+                        If None, everything is kept in memory.
+    '''
+    def __init__(self, memoryBudget: int = None):
+        self.memoryBudget = memoryBudget
+        self.memory = 0                     # Characters held in memory by our buffers
+        self.directory = None               # Temporary directory for spilled pages
+        self.buffers = weakref.WeakSet()    # Buffers created by this store
+        self.lock = threading.RLock()       # Held while buffers are written, spilled or evicted
+        self._cleanup = None                # Removes the directory when the store goes away
+
+    def buffer(self) -> PageBuffer:
+        '''Creates a new, empty page buffer'''
+        buffer = PageBuffer(self)
+        self.buffers.add(buffer)
+        return buffer
+
+    def written(self, buffer: PageBuffer, size: int) -> None:
+        '''Accounts for code written to a buffer, spilling if we're over budget'''
+        self.memory += size
+        if self.memoryBudget is not None and self.memory > self.memoryBudget:
+            self.spill()
+
+    def spill(self, budget: int = None) -> int:
+        '''Spills the largest buffers to disk until we're back under budget, and
+        returns the characters freed from memory
+            budget: Memory to get under, defaults to the store's memoryBudget'''
+        budget = self.memoryBudget if budget is None else budget
+        with self.lock:
+            # Create the temporary directory for this session
+            if self.directory is None:
+                self.directory = tempfile.mkdtemp(prefix = 'streamlit_report-')
+                self._cleanup = weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+            # Small pages stay in memory, large ones go to disk first
+            freed = 0
+            for buffer in sorted(self.buffers, key = lambda b: b.memory, reverse = True):
+                if self.memory <= budget:
+                    break
+                size = buffer.spill(self.directory)
+                self.memory -= size
+                freed += size
+            return freed
+
+    def evict(self, buffer: PageBuffer, replacement: str = '') -> int:
+        '''Drops a buffer's code, optionally writing a replacement in its place, and
+        returns the characters freed from memory'''
+        with self.lock:
+            freed = buffer.evict()
+            self.memory -= freed
+            buffer.append(replacement)
+            return freed
+
+    def release(self, buffer: PageBuffer) -> None:
+        '''Drops a buffer that is no longer part of the report'''
+        with self.lock:
+            if buffer.store is self:
+                self.memory -= buffer.memory
+                self.buffers.discard(buffer)
+                buffer.discard()
+                buffer.store = None
+
+    def close(self) -> None:
+        '''Removes the temporary directory and everything spilled to it'''
+        for buffer in list(self.buffers):
+            self.release(buffer)
+        self.memory = 0
+
+        if self._cleanup is not None:
+            self._cleanup()
+            self._cleanup = None
+        self.directory = None
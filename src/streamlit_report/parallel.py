@@ -0,0 +1,226 @@
+'''
+   Copyright 2024 Nick Xydis
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Purpose: Render the tables and charts of deferred reports in a pool of processes.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import atexit
+import io
+import os
+import pickle
+import queue
+import subprocess
+import sys
+import threading
+import warnings
+import polars as pl
+
+from streamlit_report import htmlClass
+from streamlit_report import tables
+
+# Dataframes smaller than this are rendered in the app's process, it's faster than sending them
+PARALLEL_ROWS = 1000
+
+# Command that starts a worker, see serve
+# NOTE: Workers are started with their own command instead of multiprocessing's spawn, which
+#       runs the __main__ module again in every worker and streamlit sets it to the app
+WORKER_COMMAND = [sys.executable, '-c', 'from streamlit_report.parallel import serve; serve()']
+
+_pools = {}                 # Process pools by number of workers
+_lock = threading.Lock()
+
+def serve() -> None:
+    '''Runs in a worker process: reads pickled work from stdin, runs it and writes the
+    pickled results to stdout, until the app closes stdin'''
+    tasks, results = sys.stdin.buffer, sys.stdout.buffer
+
+    # Anything the work prints goes to stderr, stdout only carries results
+    sys.stdout = sys.stderr
+    while True:
+        try:
+            function, args = pickle.load(tasks)
+        except EOFError:
+            return
+
+        try:
+            result = (True, function(*args))
+        except Exception as e:
+            result = (False, e)
+
+        # NOTE: Not every exception can be pickled, those are sent as their text
+        try:
+            data = pickle.dumps(result)
+        except Exception:
+            data = pickle.dumps((False, RuntimeError(repr(result[1]))))
+        results.write(data)
+        results.flush()
+
+class Worker:
+    '''A worker process started with WORKER_COMMAND, doing one piece of work at a time'''
+    def __init__(self):
+        # Workers import the package from the same places as the app
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join(path for path in sys.path if path)}
+        self.process = subprocess.Popen(WORKER_COMMAND, stdin = subprocess.PIPE, stdout = subprocess.PIPE, env = env)
+
+    def call(self, function, *args):
+        '''Runs the function in the worker and returns its result'''
+        try:
+            pickle.dump((function, args), self.process.stdin)
+            self.process.stdin.flush()
+            ok, result = pickle.load(self.process.stdout)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            try:
+                code = self.process.wait(timeout = 5)
+            except subprocess.TimeoutExpired:
+                code = None
+            raise BrokenProcessPool(f'A worker process exited with code {code}')
+
+        if not ok:
+            raise result
+        return result
+
+    def stop(self) -> None:
+        '''Stops the worker once it finishes its current work'''
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout = 5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+
+class WorkerPool:
+    '''
+    Worker processes shared by every session, each doing one piece of work at a time
+        workers:    Number of processes
+    '''
+    def __init__(self, workers: int):
+        self.workers = [Worker() for _ in range(workers)]
+        self.idle = queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+        self.threads = ThreadPoolExecutor(workers, thread_name_prefix = 'streamlit_report-parallel')
+
+    def call(self, function, *args):
+        '''Runs the function on the next worker that's free'''
+        worker = self.idle.get()
+        try:
+            return worker.call(function, *args)
+        finally:
+            self.idle.put(worker)
+
+    def submit(self, function, *args):
+        '''Runs the function on a worker, returning a future of its result'''
+        return self.threads.submit(self.call, function, *args)
+
+    def shutdown(self) -> None:
+        '''Stops the worker processes'''
+        self.threads.shutdown(cancel_futures = True)
+        for worker in self.workers:
+            worker.stop()
+
+def pool(workers: int) -> WorkerPool:
+    '''Returns the process pool with the given number of workers, creating it the first time'''
+    with _lock:
+        if workers not in _pools:
+            _pools[workers] = WorkerPool(workers)
+        return _pools[workers]
+
+@atexit.register
+def shutdown() -> None:
+    '''Stops the worker processes'''
+    with _lock:
+        for executor in _pools.values():
+            executor.shutdown()
+        _pools.clear()
+
+def pack(df) -> tuple:
+    '''Prepares a dataframe to be sent to a worker. Polars dataframes are sent as Arrow IPC.'''
+    if isinstance(df, pl.DataFrame):
+        try:
+            f = io.BytesIO()
+            df.write_ipc(f, compression = 'uncompressed')
+            return ('ipc', f.getvalue())
+
+        # NOTE: Object columns can't be written as Arrow, these are pickled instead
+        except Exception:
+            pass
+    return ('object', df)
+
+def unpack(payload: tuple):
+    '''Reads a dataframe sent by pack'''
+    kind, data = payload
+    if kind == 'ipc':
+        return pl.read_ipc(io.BytesIO(data))
+    return data
+
+def renderElement(kind: str, payload, option = False):
+    '''Renders one element in a worker, see html.altairChart and html.dataframe
+        option: The chart format for charts, or whether a table is virtual'''
+    if kind == 'altairChart':
+        parts = htmlClass.chartParts(payload)
+        return parts if option == 'interactive' else htmlClass.chartImage(*parts, option)
+
+    df = unpack(payload)
+    return tables.virtualData(df) if option else tables.renderTable(df)
+
+def heavy(report, kind: str, args: tuple):
+    '''Returns the work for a recorded element if it's worth rendering in a worker'''
+    # Charts are converted to json, or to images
+    if kind == 'altairChart':
+        return (kind, args[0], report.chartFormat)
+
+    # Large polars & pandas dataframes are rendered as tables
+    if kind == 'dataframe':
+        df, mode = args[0], args[3]
+        if tables.isFrame(df) and len(df) >= PARALLEL_ROWS:
+            return (kind, pack(df), tables.useVirtual(df, mode or report.tableMode))
+
+    return None
+
+def renderElements(report, pages: list) -> dict:
+    '''
+    Renders the heavy elements recorded on the given pages with the report's pool of workers.
+    Returns the results by (page, element index), the report writes them in page order.
+    '''
+    # Find the work to do
+    keys, work = [], []
+    for page in pages:
+        for i, (kind, args, _, _) in enumerate(report.pages[page].ops):
+            task = heavy(report, kind, args)
+            if task is not None:
+                keys.append((page, i))
+                work.append(task)
+
+    # Nothing worth the trip to another process
+    if len(work) < 2:
+        return {}
+
+    try:
+        executor = pool(report.workers)
+        futures = [executor.submit(renderElement, *task) for task in work]
+        return {key: future.result() for key, future in zip(keys, futures)}
+
+    # Workers that can't start, or that died, leave the work to the app's process
+    # NOTE: A worker that died takes the pool with it, the next report gets a new one
+    except (OSError, BrokenProcessPool) as e:
+        with _lock:
+            executor = _pools.pop(report.workers, None)
+        if executor is not None:
+            executor.shutdown()
+        warnings.warn(f'Rendering the report in the app, the worker processes failed: {e}')
+        return {}
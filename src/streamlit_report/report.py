@@ -24,12 +24,19 @@ from streamlit.navigation.page import StreamlitPage
 
 # Standard imports
 from pathlib import Path
+import io
+import os
+import tempfile
 import streamlit as st
 
 # Streamlit imports
 from streamlit_report import htmlClass
+from streamlit_report import assembly
+from streamlit_report import stats
+from streamlit_report.governor import governor
 from contextlib import contextmanager
 from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit.runtime.media_file_manager import MediaFileManager
 
 # If we're using an earlier version of streamlit, the original get_pages method is viable
 if Version(st.__version__) < Version("1.44.0"):
@@ -39,6 +46,9 @@ if Version(st.__version__) < Version("1.44.0"):
 else:
     get_pages: function = None
 
+# Newer versions of streamlit take a function for the download button's data, called on click
+deferredDownloads = hasattr(MediaFileManager, 'add_deferred')
+
 class Report:
     def __init__(
             self, 
@@ -46,6 +56,20 @@ class Report:
             pageOrder: list = None,
             styleFile: str = None,
             startActive: bool = False,
+            memoryBudget: int = None,
+            tableMode: str = 'static',
+            maxRows: int = None,
+            rowPolicy: str = 'head',
+            deferred: bool = False,
+            shareFragments: bool = False,
+            offline: bool = False,
+            vegaBundle: str = None,
+            chartFormat: str = 'interactive',
+            compact: bool = False,
+            lazyPages: bool = False,
+            workers: int = None,
+            statsHook = None,
+            statsOverlay: bool = False,
         ):
         '''
         duplicatePages: Allow for the program to create multiple pages for 
@@ -56,6 +80,51 @@ class Report:
         startActive:    True / False option. If True, reports will default to generating the
                         html code. 
                         NOTE: This only takes effect on the first module to initialize a report.
+        memoryBudget:   Approximate number of bytes of page code to keep in memory. Once
+                        exceeded, the largest pages are written to temporary files until
+                        the report is downloaded. If None, everything stays in memory.
+        tableMode:      How dataframes are written to the report. 'static' writes every row
+                        as an html table, 'virtual' embeds the data and only draws the rows
+                        scrolled into view, 'auto' uses virtual tables for large dataframes.
+        maxRows:        Most rows of a dataframe written to the report. Larger dataframes
+                        are shortened with the rowPolicy and the table says what was left
+                        out. If None, every row is written.
+        rowPolicy:      How dataframes larger than maxRows are shortened. 'head' or 'tail'
+                        keep the first or last rows, 'headTail' keeps both ends, 'sample'
+                        keeps a random sample that's the same every run, and 'summary'
+                        writes the type, missing values, range and quartiles of each
+                        column instead. With maxRows = None, 'summary' applies to every
+                        dataframe.
+        deferred:       If True, report elements are only recorded while the app runs and
+                        are converted to html when the report is built for download.
+                        NOTE: Objects are rendered as they are at download time, so pandas
+                        dataframes or charts changed in place after the call will show
+                        their changes.
+        shareFragments: If True, large rendered fragments (tables, chart specs, markdown)
+                        are kept once per process and shared by every session that
+                        renders the same content. See cache.fragmentStore.stats().
+        offline:        If True, the vega runtime is inlined in the report once, so charts
+                        render without network access. Needs vl-convert-python or vegaBundle.
+        vegaBundle:     Directory with vega.min.js, vega-lite.min.js and vega-embed.min.js
+                        to inline in offline reports.
+        chartFormat:    How charts are written to the report. 'interactive' draws them with
+                        vega-embed when the report is opened, 'svg' or 'png' converts each
+                        chart to an image once, when the report is made, so opening it
+                        doesn't need the vega runtime. Images are cached by the chart's
+                        spec, see htmlClass.chartImageCache. Needs vl-convert-python.
+        compact:        If True, the report's own code is minified and pages are styled
+                        with classes instead of repeated inline styles and line breaks.
+        lazyPages:      If True, pages other than the first are kept in <template> elements
+                        and only added to the report's document the first time they're
+                        opened, and charts are drawn as they're scrolled into view. Large
+                        reports open faster, as only the first page is laid out.
+        workers:        Number of processes used to render large dataframes and charts
+                        when a deferred report is built. If None, they're rendered in
+                        the app's process. Only used with deferred = True.
+        statsHook:      Optional callback given the timing and size of each element and
+                        assembly of this report, see stats.addHook for the events.
+        statsOverlay:   If True, a table of the report's stats is shown under the download
+                        button, for debugging. See also Report.stats().
         '''
         # Session_state shorthand
         self.session_state = st.session_state
@@ -63,8 +132,9 @@ class Report:
         
         # Inititialization
         self.styleFile = styleFile
+        self.memoryBudget = memoryBudget
         self.init('htmlReport', startActive)
-        self.init('html', htmlClass.html(self.styleFile))
+        self.init('html', htmlClass.html(self.styleFile, self.memoryBudget))
         self.duplicatePages = duplicatePages
 
         # Redefine page numbers
@@ -76,6 +146,11 @@ class Report:
         # If we already have an html report going, preserve it
         self.html: htmlClass.html = self.ss.html
 
+        # Let the process-wide memory governor know the session is in use, and writing to its
+        # report until download() is called
+        governor.touch(self.html)
+        self.html.running = True
+
         # Get and store the name of the current page
         try:
             self.html.pageName = self.pageName()
@@ -96,6 +171,39 @@ class Report:
         # Set the default page order of the report
         self.html.order = pageOrder
 
+        # Set how dataframes are written
+        self.html.tableMode = tableMode
+        self.maxRows = maxRows
+        self.rowPolicy = rowPolicy
+
+        # Record elements now and render them when the report is built
+        self.html.deferred = deferred
+        self.html.workers = workers
+
+        # Instrumentation
+        self.html.stats.hook = statsHook
+        self.statsOverlay = statsOverlay
+
+        # Share identical content with other sessions
+        self.html.shareFragments = shareFragments
+
+        # Inline the chart runtime for reports viewed without network access
+        self.html.offline = offline
+        self.html.vegaBundle = vegaBundle
+
+        # Draw charts when the report is opened, or convert them to images
+        if chartFormat not in htmlClass.CHART_FORMATS:
+            raise ValueError(f'Unknown chart format {chartFormat!r}, expected one of {htmlClass.CHART_FORMATS}')
+        self.html.chartFormat = chartFormat
+
+        # Smaller output for large reports
+        self.html.compact = compact
+        self.html.lineBreak = not compact
+
+        # Only lay out pages and draw charts as they're shown
+        self.html.lazyPages = lazyPages
+        self.init('streamlit_report-build', False)
+
         # Option to ignore fields from the report
         self.ignore = False
 
@@ -117,6 +225,25 @@ class Report:
         if variable not in self.ss:
             self.ss[variable] = value
 
+    def measure(self, kind: str):
+        '''Context manager that adds the time and code of an element to the report's stats'''
+        return self.html.measure(kind)
+
+    def stats(self) -> dict:
+        '''
+        Returns the report's stats: the number of calls, time spent and code added for each
+        page and kind of element, the time taken to assemble the report and the code
+        retained by each page. Totals add up over every run of the app.
+        '''
+        return self.html.statsSummary()
+
+    def showStats(self) -> None:
+        '''Shows the report's stats in the app'''
+        summary = self.stats()
+        with st.expander('Report stats'):
+            st.dataframe(stats.rows(summary))
+            st.json({'assembly': summary['assembly'], 'retained': summary['retained']}, expanded = False)
+
     def pageName(self) -> str:
         '''Gets and returns the filename of the running page'''
         # Modified code from blackary in discussion link below...
@@ -152,7 +279,8 @@ class Report:
 
         # If we're making a report, add to it
         if self.ss['htmlReport'] and self.ignore == False:
-            self.html.write(text)
+            with self.measure('write'):
+                self.html.write(text)
 
     def markdown(self, text: 'str', **kwargs) -> None:
         '''Mimics st.markdown'''
@@ -161,33 +289,50 @@ class Report:
 
         # If we're making a report, add to it
         if self.ss['htmlReport'] and self.ignore == False:
+            with self.measure('markdown'):
+                # If we're allowing unsafe html, write to the report directly
+                # NOTE: Removed explicit callout for standard streamlit usage
+                if 'unsafe_allow_html' in kwargs and kwargs['unsafe_allow_html']:
+                    self.html.html(text)
             
-            # If we're allowing unsafe html, write to the report directly
-            # NOTE: Removed explicit callout for standard streamlit usage
-            if 'unsafe_allow_html' in kwargs and kwargs['unsafe_allow_html']:
-                self.html.html(text)
-            
-            # Otherwise, write to the report
-            else:
-                self.html.write(text)
+                # Otherwise, write to the report
+                else:
+                    self.html.write(text)
 
     def dataframe(
             self, 
             df: DataFrame,      # type: ignore 
             height: str = '400px', 
             width: str = '60%', 
+            mode: str = None,
+            maxRows: int = None,
+            rowPolicy: str = None,
+            seed: int = 0,
             **kwargs
             ) -> None:
         '''
         Mimics st.dataframe
         NOTE: The height and width variables are no longer used.
+            mode:       'static', 'virtual' or 'auto'. Overrides the report's tableMode.
+            maxRows:    Most rows written to the report. Overrides the report's maxRows.
+            rowPolicy:  'head', 'tail', 'headTail', 'sample' or 'summary'. Overrides the
+                        report's rowPolicy.
+            seed:       Seed for the 'sample' row policy.
         '''
         # streamlit
         st.dataframe(df, **kwargs)
 
         # If we're making a report, add to it
         if self.ss['htmlReport'] and self.ignore == False:
-            self.html.dataframe(df, height, width)
+            with self.measure('dataframe'):
+                # Large dataframes are shortened with the row policy
+                # NOTE: In deferred reports this happens when the report is built
+                self.html.dataframe(
+                    df, height, width, mode,
+                    maxRows = maxRows if maxRows is not None else self.maxRows,
+                    rowPolicy = rowPolicy or self.rowPolicy,
+                    seed = seed,
+                )
 
     def selectbox(self, label: str, options: list, **kwargs) -> str:
         '''Mimics st.selectbox'''
@@ -196,11 +341,12 @@ class Report:
         
         # If we're making a report, add to it
         if self.ss['htmlReport'] and self.ignore == False:
-            self.html.write(f"{self.heading} {label}{self.reportLabel}")
-            if selection:
-                self.html.write(f"{selection}")
-            else:
-                self.html.write("Nothing selected")
+            with self.measure('selectbox'):
+                self.html.write(f"{self.heading} {label}{self.reportLabel}")
+                if selection:
+                    self.html.write(f"{selection}")
+                else:
+                    self.html.write("Nothing selected")
 
         # Return the selection
         return selection
@@ -217,12 +363,13 @@ class Report:
 
         # If we're making a report, add to it
         if self.ss['htmlReport'] and self.ignore == False:
-            self.html.write(f"{self.heading} {label}{self.reportLabel}")
-            if len(values) > 0:
-                # Write each selection as a comma separated list
-                self.html.write(f"{', '.join(str(item) for item in values)}")
-            else:
-                self.html.write("Nothing selected")
+            with self.measure('multiselect'):
+                self.html.write(f"{self.heading} {label}{self.reportLabel}")
+                if len(values) > 0:
+                    # Write each selection as a comma separated list
+                    self.html.write(f"{', '.join(str(item) for item in values)}")
+                else:
+                    self.html.write("Nothing selected")
 
         # Return the selected data
         return values
@@ -234,7 +381,8 @@ class Report:
 
         # If we're making a report, add to it
         if self.ss['htmlReport'] and self.ignore == False:
-            self.html.write(f'{body}')
+            with self.measure('text'):
+                self.html.write(f'{body}')
     
     def text_area(self, label: str, **kwargs) -> str:
         '''Mimics st.text_area'''
@@ -243,11 +391,12 @@ class Report:
 
         # If we're making a report, add to it
         if self.ss['htmlReport'] and self.ignore == False:
-            self.html.write(f'{self.heading} {label}{self.textLabel}')
-            if value:
-                self.html.write(f'{value}')
-            else:
-                self.html.write('No input')
+            with self.measure('text_area'):
+                self.html.write(f'{self.heading} {label}{self.textLabel}')
+                if value:
+                    self.html.write(f'{value}')
+                else:
+                    self.html.write('No input')
 
         return value
 
@@ -258,11 +407,12 @@ class Report:
 
         # If we're making a report, add to it
         if self.ss['htmlReport'] and self.ignore == False:
-            self.html.write(f'{self.heading} {label}{self.textLabel}')
-            if value:
-                self.html.write(f'{value}')
-            else:
-                self.html.write('No input')
+            with self.measure('text_input'):
+                self.html.write(f'{self.heading} {label}{self.textLabel}')
+                if value:
+                    self.html.write(f'{value}')
+                else:
+                    self.html.write('No input')
 
         return value
 
@@ -273,15 +423,16 @@ class Report:
 
         # If we're making a report, add to it
         if self.ss['htmlReport'] and self.ignore == False:
-            self.html.write(f"{self.heading} {label}{self.reportLabel}")
+            with self.measure('slider'):
+                self.html.write(f"{self.heading} {label}{self.reportLabel}")
             
-            # Check if we have a range of results
-            if 'value' in kwargs and type(kwargs['value']) == tuple:
-                self.html.write(f"{result[0]} to {result[1]}")
+                # Check if we have a range of results
+                if 'value' in kwargs and type(kwargs['value']) == tuple:
+                    self.html.write(f"{result[0]} to {result[1]}")
 
-            # Otherwise, display the single result
-            else:
-                self.html.write(f"{result}")
+                # Otherwise, display the single result
+                else:
+                    self.html.write(f"{result}")
 
         # Return the slider output
         return result
@@ -295,18 +446,18 @@ class Report:
 
         # If we're making a report... convert the date
         if self.ss['htmlReport'] and self.ignore == False:
-            
-            # Process using the given function if provided 
-            if self.dateFormatFunc:
-                newValue = self.dateFormatFunc(value)
+            with self.measure('date_input'):
+                # Process using the given function if provided 
+                if self.dateFormatFunc:
+                    newValue = self.dateFormatFunc(value)
 
-            # Otherwise convert to a string
-            else:
-                newValue = str(value)
+                # Otherwise convert to a string
+                else:
+                    newValue = str(value)
 
-            # Add to the report
-            self.html.write(f"{self.heading} {label}{self.reportLabel}")
-            self.html.write(f"{newValue}")  
+                # Add to the report
+                self.html.write(f"{self.heading} {label}{self.reportLabel}")
+                self.html.write(f"{newValue}")  
 
         # Return the st output
         return value  
@@ -324,16 +475,9 @@ class Report:
         if nav.title not in redefine and self.scriptHash:
             redefine[self.scriptHash] = nav.title
 
-            # For all items to redefine, change the pageNames
-            replace = None
-            for pageName, pageNumber in self.html.pageNames.items():
-                if pageName == self.scriptHash:
-                    replace = pageName
-                    break
-
-            # Replace the item
-            if replace:
-                self.html.pageNames[redefine[replace]] = self.html.pageNames.pop(replace)
+            # Rename the page from its script hash to its title
+            if self.scriptHash in self.html.pageNames:
+                self.html.pages.rename(self.scriptHash, redefine[self.scriptHash])
 
         return nav
 
@@ -355,7 +499,8 @@ class Report:
         
         # Create the html tab buttons, if we're creating a report
         if self.ss['htmlReport'] and self.ignore == False:
-            self.html.tabBar(items)
+            with self.measure('tabs'):
+                self.html.tabBar(items)
 
         # streamlit
         # Create the tabs
@@ -363,7 +508,8 @@ class Report:
         tabsList = []
 
         # Create the tab group name
-        group = f"group_{self.html.tabGroup}_tablink"
+        # NOTE: Tab groups are numbered per page, so the name includes the page
+        group = f"page_{self.html.page}_group_{self.html.tabGroup}_tabcontent"
         
         # Unzip the items and write to each of them
         i = 0
@@ -396,32 +542,193 @@ class Report:
 
         # HTML
         if self.ss['htmlReport'] and self.ignore == False:
-            self.html.altairChart(chart)
+            with self.measure('altair_chart'):
+                self.html.altairChart(chart)
 
-    def download(self, reportName: 'str' = 'output') -> None:
+    def download(
+            self, 
+            reportName: 'str' = 'output', 
+            stream: bool = False, 
+            compression: str = None, 
+            background: bool = False,
+        ) -> None:
         '''
         Runs the application and downloads the html
-            reportName: Name of the report when generated
+            reportName:     Name of the report when generated
+            stream:         If True, the report is written to a temporary file piece by piece
+                            and the file is handed to the download button, so the full report
+                            is never built as a string. The file is only written when the
+                            button is clicked, if this version of streamlit supports it.
+                            Recommended for very large reports. NOTE: Streamlit still reads
+                            the file into memory to serve it, use export() to avoid that.
+            compression:    'gzip' downloads a .html.gz file, 'selfExtracting' downloads an
+                            .html file that decompresses itself when opened in a browser.
+                            Compressed reports are always streamed.
+            background:     If True, the report is assembled on a background thread and the
+                            app shows its progress until the download is ready. A newer run
+                            with different content replaces an assembly still in progress.
         '''
         # If the flag is on, create the report
         if self.ss['htmlReport'] == True:
-            # Make the report...
-            self.html.generateReport()
+            building = False
+
+            # Keep the process within its memory budget
+            governor.enforce(self.html)
+
+            # Deferred reports are only built when asked for
+            if self.html.deferred and not self.ss['streamlit_report-build']:
+                st.button('Build Report', on_click = self.buildReport)
+
+            # Assemble the report in the background...
+            elif background:
+                building = not self.assembleReport(reportName, compression)
+
+            # Stream the report through a temporary file...
+            elif stream or compression:
+                fileName, mime = f'{reportName}.html', 'text/html'
+                if compression == 'gzip':
+                    fileName, mime = f'{reportName}.html.gz', 'application/gzip'
+
+                st.download_button("Download!", self.streamReport(compression), fileName, mime = mime)
+
+            # Or make the report...
+            else:
+                self.html.generateReport()
+
+                # Download button
+                st.download_button("Download!", self.html.report, f'{reportName}.html')
+
+            # Deferred reports are built again on request
+            # NOTE: Unless the report is still being assembled in the background
+            if not building:
+                self.ss['streamlit_report-build'] = False
 
-            # Download button
-            st.download_button("Download!", self.html.report, f'{reportName}.html')
             helpText = "Stopping report generation can improve application speeds"
             st.button('Stop Report Generation', on_click = self.generateReport, help = helpText)
+
+            # Debugging overlay
+            if self.statsOverlay:
+                self.showStats()
         else:
             # Otherwise ask to download
             st.button('Generate Report?', on_click = self.generateReport)
+
+        # The run is done writing to the report, the governor may evict it now
+        self.html.running = False
     
+    def streamReport(self, compression: str = None):
+        '''Data for the download button of a streamed report: a function that writes the
+        report as it is now to a temporary file when the button is clicked, or the written
+        file if this version of streamlit can't wait for the click'''
+        snapshot = self.html.snapshot()
+        def write():
+            with tempfile.TemporaryFile() as f:
+                htmlClass.writeChunks(snapshot.chunks(), f, compression)
+                f.flush()
+
+                # NOTE: Streamlit reads raw file objects, this one stays open once the with block closes f
+                return io.FileIO(os.dup(f.fileno()), 'rb')
+
+        return write if deferredDownloads else write()
+
+    def assembleReport(self, reportName: str, compression: str = None) -> bool:
+        '''Starts assembling the report in the background, or shows the download
+        button once the assembly for the current content has finished.
+        Returns True if the download is ready.'''
+        fileName, mime = f'{reportName}.html', 'text/html'
+        if compression == 'gzip':
+            fileName, mime = f'{reportName}.html.gz', 'application/gzip'
+
+        # Keep the running assembly if the report hasn't changed, otherwise replace it
+        # NOTE: A failed assembly is tried again on the next run
+        snapshot = self.html.snapshot()
+        job: assembly.AssemblyJob = self.ss.get('streamlit_report-assembly')
+        if job is None or job.error is not None or not job.matches(snapshot, compression):
+            if job is not None:
+                job.cancel()
+            job = assembly.AssemblyJob(snapshot, compression)
+            self.ss['streamlit_report-assembly'] = job
+
+        # Download button once the report is ready
+        if job.done and job.error is None:
+            st.download_button("Download!", job.result(), fileName, mime = mime)
+            return True
+
+        # Otherwise show the progress, checking in on the job until it's done
+        def progress():
+            if job.done and job.error is None:
+                st.rerun()
+            elif job.done:
+                st.error(f'Report assembly failed: {job.error}')
+            else:
+                st.progress(job.progress, text = 'Preparing report...')
+
+        # NOTE: Older versions of streamlit don't have fragments, so we ask to refresh instead
+        if hasattr(st, 'fragment'):
+            st.fragment(progress, run_every = 0.5)()
+        else:
+            progress()
+            st.button('Refresh')
+        return False
+
+    def cancelAssembly(self) -> None:
+        '''Cancels a background assembly that is still running'''
+        job = self.ss.get('streamlit_report-assembly')
+        if job is not None:
+            job.cancel()
+            del self.ss['streamlit_report-assembly']
+
+    def buildReport(self) -> None:
+        '''Builds a deferred report on the next run of the app'''
+        self.ss['streamlit_report-build'] = True
+
+    def export(self, target, compression: str = None) -> None:
+        '''
+        Writes the report to a file path or writable file object (e.g. a response body)
+        one piece at a time, without building the full report in memory
+            compression:    Optional 'gzip' or 'selfExtracting', written as bytes
+        '''
+        self.html.writeReport(target, compression)
+
+    def exportDirectory(self, directory: str) -> dict:
+        '''
+        Writes the report to a directory: an index.html, one file per page, the shared
+        styles and scripts in assets/ and a manifest.json with a hash of each file. Exporting
+        to the same directory again only rewrites the pages that changed.
+        Returns the names of the files written, left unchanged and removed.
+        '''
+        return self.html.writeDirectory(directory)
+
+    def saveSnapshot(self, target) -> None:
+        '''
+        Saves the report's pages to a compressed snapshot file, so the report can be
+        restored into a new session with restoreSnapshot, e.g. after the server restarts.
+            target: Path or writable binary file object
+        '''
+        self.html.saveSnapshot(target)
+
+    def restoreSnapshot(self, source, rerun: bool = True) -> None:
+        '''
+        Replaces the report with a snapshot saved by saveSnapshot and turns the report on.
+        Pages are read from the snapshot as they're needed, so it must stay readable.
+            source: Path or binary file object, e.g. from st.file_uploader
+            rerun:  If True, the app is run again so the current page is written over the
+                    snapshot's copy of it
+        '''
+        self.cancelAssembly()
+        self.html.restoreSnapshot(source)
+        self.ss['htmlReport'] = True
+        if rerun:
+            st.rerun()
+
     def generateReport(self) -> None:
         '''Alternates the report generate value'''
         # If we're not generating a report, clear the saved html code
         if self.ss['htmlReport'] == True:
             self.ss['htmlReport'] = False
-            self.ss.html = htmlClass.html(styleFile = self.styleFile)
+            self.cancelAssembly()
+            self.ss.html.close()
+            self.ss.html = htmlClass.html(styleFile = self.styleFile, memoryBudget = self.memoryBudget)
         else:
             self.ss['htmlReport'] = True
 
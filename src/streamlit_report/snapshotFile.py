@@ -0,0 +1,200 @@
+'''
+   Copyright 2024 Nick Xydis
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Purpose: Save the pages of a report to a compressed snapshot file, and restore them into
+a new session, e.g. after the server restarts.
+
+A snapshot is a zip file with each page's code compressed on its own, so pages are read
+back one at a time as they're needed:
+    manifest.json                   Format, version and the page registry
+    pages/<number>/<section>        Body, sidebar and chart script code of each page
+    datasets/<index>                Chart data shared by the report's charts
+'''
+
+import hashlib
+import json
+import threading
+import zipfile
+
+FORMAT = 'streamlit_report-snapshot'
+VERSION = 1
+MANIFEST = 'manifest.json'
+
+# Page code buffers saved in a snapshot, see pageRegistry.Page
+SECTIONS = ('body', 'sidebar', 'chartScript')
+
+class SnapshotReader:
+    '''
+    An open snapshot file that page code is read from as it's needed
+        source: Path or binary file object of the snapshot
+    '''
+    def __init__(self, source):
+        self.zip = zipfile.ZipFile(source)
+        self.lock = threading.Lock()
+
+        # Check the snapshot is one we can read
+        try:
+            manifest = json.loads(self.zip.read(MANIFEST))
+        except KeyError:
+            raise ValueError('Not a report snapshot, it has no manifest')
+        if manifest.get('format') != FORMAT:
+            raise ValueError(f'Not a report snapshot, unknown format {manifest.get("format")!r}')
+        if manifest.get('version', 0) > VERSION:
+            raise ValueError(
+                f'Report snapshot version {manifest["version"]} is newer than this version '
+                f'of streamlit_report reads ({VERSION})'
+            )
+        self.manifest = manifest
+
+    def read(self, member: str) -> str:
+        '''Reads and decompresses one member of the snapshot'''
+        with self.lock:
+            return self.zip.read(member).decode('utf-8', 'surrogatepass')
+
+class SnapshotPart:
+    '''
+    Code of one page section or dataset in a snapshot, only read from the file the first
+    time it's used. Page buffers hold these like shared fragments, see cache.SharedFragment.
+    '''
+    __slots__ = ('reader', 'member', 'size', 'key', '_text')
+
+    def __init__(self, reader: SnapshotReader, entry: dict):
+        self.reader = reader
+        self.member = entry['member']
+        self.size = entry['size']                   # Characters of code
+        self.key = bytes.fromhex(entry['hash'])     # Hash of the code
+        self._text = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.reader.read(self.member)
+        return self._text
+
+    def release(self) -> None:
+        '''Called when a page no longer holds the code'''
+        self._text = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __str__(self) -> str:
+        return self.text
+
+def writeMember(archive: zipfile.ZipFile, member: str, chunks) -> dict:
+    '''Writes code to the snapshot one piece at a time and returns its manifest entry'''
+    h = hashlib.blake2b(digest_size = 20)
+    size = 0
+    with archive.open(member, 'w') as f:
+        for chunk in chunks:
+            data = chunk.encode('utf-8', 'surrogatepass')
+            h.update(data)
+            f.write(data)
+            size += len(chunk)
+    return {'member': member, 'size': size, 'hash': h.hexdigest()}
+
+def save(report, target, compresslevel: int = 6) -> dict:
+    '''
+    Saves the report's pages to a snapshot file and returns its manifest
+        report: The report's html object, see htmlClass.html
+        target: Path or writable binary file object
+    NOTE: Deferred elements are rendered first, the objects they hold can't be saved
+    '''
+    report.render()
+
+    registry = report.pages
+    manifest = {
+        'format':       FORMAT,
+        'version':      VERSION,
+        'pages':        [],
+        'names':        dict(registry.numbers),
+        'requested':    registry.requested,
+        'tablePages':   sorted(report.tablePages),
+        'datasets':     {},
+    }
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED, compresslevel = compresslevel) as archive:
+        for page in registry:
+            if page.body is None:
+                continue
+
+            entry = {
+                'number':   page.number,
+                'name':     page.name,
+                'charts':   page.charts,
+                'tables':   page.tables,
+                'datasets': sorted(page.datasets),
+                'sections': {},
+            }
+            for section in SECTIONS:
+                buffer = getattr(page, section)
+                if len(buffer):
+                    entry['sections'][section] = writeMember(archive, f'pages/{page.number}/{section}', buffer.chunks())
+            manifest['pages'].append(entry)
+
+        # Chart data, named by a hash of its contents
+        for i, (name, data) in enumerate(report.datasets.items()):
+            manifest['datasets'][name] = writeMember(archive, f'datasets/{i}', [str(data)])
+
+        # NOTE: The manifest is written last, a snapshot without one can't be restored
+        archive.writestr(MANIFEST, json.dumps(manifest))
+
+    return manifest
+
+def restore(report, source) -> dict:
+    '''
+    Replaces the report's pages with the pages of a snapshot and returns its manifest.
+    Page code stays in the snapshot file until the page is written out or run again.
+        report: The report's html object, see htmlClass.html
+        source: Path or binary file object of the snapshot, which must stay readable
+                while the report is in use
+    '''
+    reader = SnapshotReader(source)
+    manifest = reader.manifest
+
+    with report.store.lock:
+        # Drop the current pages
+        report.store.close()
+        registry = report.pages
+        registry.clear()
+
+        for entry in manifest['pages']:
+            page = registry.page(entry['number'])
+            page.name = entry['name']
+            page.charts = entry['charts']
+            page.tables = entry['tables']
+            page.datasets = set(entry['datasets'])
+            for section in SECTIONS:
+                buffer = report.store.buffer()
+                if section in entry['sections']:
+                    buffer.append(SnapshotPart(reader, entry['sections'][section]))
+                setattr(page, section, buffer)
+
+        registry.numbers.update(manifest['names'])
+        registry.setOrder(manifest['requested'])
+
+        for data in report.datasets.values():
+            if not isinstance(data, str):
+                data.release()
+        report.datasets = {name: SnapshotPart(reader, data) for name, data in manifest['datasets'].items()}
+        report.tablePages = set(manifest['tablePages'])
+        report.report = None
+        report.reportKey = None
+
+        # Keep the current page usable until the app runs it again
+        if report.page not in registry:
+            report.clear()
+        report.altairCharts = bool(report.chartScript[report.page])
+
+    return manifest
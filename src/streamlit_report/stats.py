@@ -0,0 +1,137 @@
+'''
+   Copyright 2024 Nick Xydis
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Purpose: Measure the time and code size of each part of a report.
+'''
+
+import logging
+import threading
+
+# Callbacks given every event of every report in the process, see addHook
+hooks = []
+_lock = threading.Lock()
+
+def addHook(callback) -> None:
+    '''
+    Adds a callback that is given each event as a dictionary, e.g. to send them to a
+    metrics pipeline. Events are either:
+        {'event': 'element', 'page': ..., 'kind': ..., 'count': ..., 'seconds': ..., 'bytes': ...}
+        {'event': 'assembly', 'mode': ..., 'seconds': ..., 'bytes': ...}
+    NOTE: Callbacks run on the thread that wrote the report, so they should be quick.
+    '''
+    with _lock:
+        if callback not in hooks:
+            hooks.append(callback)
+
+def removeHook(callback) -> None:
+    '''Removes a callback added with addHook'''
+    with _lock:
+        if callback in hooks:
+            hooks.remove(callback)
+
+def logHook(logger: logging.Logger = None, level: int = logging.DEBUG):
+    '''Returns a callback for addHook that logs each event'''
+    logger = logger or logging.getLogger('streamlit_report')
+    def hook(event: dict) -> None:
+        logger.log(level, 'streamlit_report %s', event)
+    return hook
+
+class ElementStats:
+    '''Totals for one kind of element on one page'''
+    __slots__ = ('count', 'seconds', 'bytes')
+
+    def __init__(self):
+        self.count = 0              # Number of calls
+        self.seconds = 0.0          # Time spent writing the report code
+        self.bytes = 0              # Characters of code added to the page
+
+    def add(self, count: int, seconds: float, size: int) -> None:
+        self.count += count
+        self.seconds += seconds
+        self.bytes += size
+
+    def asDict(self) -> dict:
+        return {'count': self.count, 'seconds': self.seconds, 'bytes': self.bytes}
+
+class ReportStats:
+    '''
+    Counts, time and code size for each page and kind of element of a report, along
+    with the time taken to assemble it. Totals add up over every run of the app.
+        hook:   Optional callback given each event of this report, see addHook
+    '''
+    def __init__(self, hook = None):
+        self.elements = {}              # (page number, kind) -> ElementStats
+        self.assembly = {}              # Assembly mode -> ElementStats
+        self.hook = hook
+
+    def emit(self, event: dict) -> None:
+        '''Passes an event to the report's hook and the process-wide hooks'''
+        if self.hook is not None:
+            self.hook(event)
+        for callback in hooks:
+            callback(event)
+
+    def add(self, page: int, kind: str, seconds: float, size: int, count: int = 1) -> None:
+        '''Adds a measurement of an element
+            count:  0 if the element was already counted, e.g. when a deferred element is rendered'''
+        key = (page, kind)
+        if key not in self.elements:
+            self.elements[key] = ElementStats()
+        self.elements[key].add(count, seconds, size)
+
+        if self.hook is not None or hooks:
+            self.emit({'event': 'element', 'page': page, 'kind': kind, 'count': count, 'seconds': seconds, 'bytes': size})
+
+    def assembled(self, mode: str, seconds: float, size: int) -> None:
+        '''Adds a measurement of the report being assembled
+            mode:   'generate' for the report string, 'write' for reports written to files,
+                    'directory' for reports exported to a directory'''
+        if mode not in self.assembly:
+            self.assembly[mode] = ElementStats()
+        self.assembly[mode].add(1, seconds, size)
+
+        if self.hook is not None or hooks:
+            self.emit({'event': 'assembly', 'mode': mode, 'seconds': seconds, 'bytes': size})
+
+    def reset(self) -> None:
+        '''Clears the totals'''
+        self.elements.clear()
+        self.assembly.clear()
+
+    def summary(self, pageNames: dict = None) -> dict:
+        '''Totals by page and by kind
+            pageNames:  Page names by page number, pages without one are named by number'''
+        pageNames = pageNames or {}
+        pages, kinds = {}, {}
+        for (page, kind), element in self.elements.items():
+            name = pageNames.get(page, page)
+            pages.setdefault(name, {})[kind] = element.asDict()
+
+            total = kinds.setdefault(kind, ElementStats())
+            total.add(element.count, element.seconds, element.bytes)
+
+        return {
+            'pages':    pages,
+            'kinds':    {kind: total.asDict() for kind, total in kinds.items()},
+            'assembly': {mode: total.asDict() for mode, total in self.assembly.items()},
+        }
+
+def rows(summary: dict) -> list:
+    '''Flattens the page totals of a summary into one row per page and kind, for display'''
+    return [
+        {'page': page, 'kind': kind, **totals}
+        for page, elements in summary['pages'].items()
+        for kind, totals in elements.items()
+    ]
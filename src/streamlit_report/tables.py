@@ -0,0 +1,323 @@
+'''
+   Copyright 2024 Nick Xydis
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+
+Purpose: Render dataframes as html tables without going through pandas' html formatter.
+'''
+
+import functools
+import json
+import operator
+import polars as pl
+
+# Table modes: 'static' writes every row into the report, 'virtual' embeds the data and
+# only draws the rows in view, 'auto' uses virtual tables for frames larger than VIRTUAL_ROWS
+TABLE_MODES = ('static', 'virtual', 'auto')
+VIRTUAL_ROWS = 1000
+
+# Row policies for dataframes larger than the report's maxRows: 'head' keeps the first rows,
+# 'tail' the last rows, 'headTail' both ends, 'sample' a repeatable random sample of rows
+# and 'summary' replaces the rows with a summary of each column
+ROW_POLICIES = ('head', 'tail', 'headTail', 'sample', 'summary')
+SUMMARY_QUANTILES = (0.25, 0.5, 0.75)
+
+# Table code matching the layout of pandas' DataFrame.to_html so the styles still apply
+TABLE_OPEN = '<table border="1" class="dataframe">\n'
+HEAD_OPEN = '  <thead>\n    <tr style="text-align: right;">\n'
+HEAD_CLOSE = '    </tr>\n  </thead>\n  <tbody>\n'
+TABLE_CLOSE = '  </tbody>\n</table>'
+ROW_OPEN = '    <tr>\n'
+ROW_CLOSE = '    </tr>\n'
+CELL_OPEN = '      <td>'
+CELL_CLOSE = '</td>\n'
+
+def escape(text: str) -> str:
+    '''Escapes the characters that have meaning in html'''
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def header(columns) -> str:
+    '''Code for the table header'''
+    cells = ''.join(f'      <th>{escape(str(name))}</th>\n' for name in columns)
+    return TABLE_OPEN + HEAD_OPEN + cells + HEAD_CLOSE
+
+def nestedText(value) -> str:
+    '''Formats a list, array, struct, binary or object value as text'''
+    # NOTE: Array cells arrive as polars' internal series, which only have to_list
+    return str(value.to_list() if hasattr(value, 'to_list') else value)
+
+def polarsCell(name: str, dtype, escapeHtml: bool = True) -> pl.Expr:
+    '''Expression that formats and escapes one column of cells as text'''
+    col = pl.col(name)
+
+    # Match the way pandas displays booleans and missing values
+    if dtype == pl.Boolean:
+        # NOTE: Missing values are kept as nulls, otherwise they'd show as False
+        text = pl.when(col.is_null()).then(pl.lit(None, pl.String)).when(col).then(pl.lit('True')).otherwise(pl.lit('False'))
+    elif dtype == pl.Duration:
+        # Durations have no string cast
+        text = col.dt.to_string('polars')
+    elif dtype.is_nested() or dtype in (pl.Object, pl.Binary):
+        # NOTE: Nested values have no string cast, so these are formatted one by one
+        text = col.map_elements(nestedText, return_dtype = pl.String, skip_nulls = True)
+    else:
+        text = col.cast(pl.String)
+
+    # Numbers, booleans and dates never need escaping, anything else might contain html
+    safe = dtype.is_numeric() or dtype.is_temporal() or dtype in (pl.Boolean, pl.Null)
+    if escapeHtml and not safe:
+        text = (text
+            .str.replace_all('&', '&amp;', literal = True)
+            .str.replace_all('<', '&lt;', literal = True)
+            .str.replace_all('>', '&gt;', literal = True)
+        )
+
+    missing = 'NaN' if dtype.is_float() else ('NaT' if dtype.is_temporal() else 'None')
+    return text.fill_null(pl.lit(missing))
+
+def polarsTable(df: pl.DataFrame) -> str:
+    '''Renders a polars dataframe as an html table using column expressions, or with
+    pandas if a column's type can't be formatted'''
+    try:
+        return polarsRows(df)
+    except pl.exceptions.PolarsError:
+        return pandasTable(df.to_pandas())
+
+def polarsRows(df: pl.DataFrame) -> str:
+    '''Renders a polars dataframe as an html table using column expressions'''
+    # Build every row of the table as a single string column...
+    cells = []
+    for name, dtype in df.schema.items():
+        cells += [pl.lit(CELL_OPEN), polarsCell(name, dtype), pl.lit(CELL_CLOSE)]
+    rows = pl.concat_str([pl.lit(ROW_OPEN), *cells, pl.lit(ROW_CLOSE)])
+
+    # ...then join the rows together in one pass
+    body = df.select(rows.str.join('')).item() if df.height and df.width else ''
+
+    return header(df.columns) + (body or '') + TABLE_CLOSE
+
+def pandasCell(series, escapeHtml: bool = True) -> 'Series':  # type: ignore
+    '''Formats and escapes one column of a pandas dataframe as text'''
+    kind = series.dtype.kind
+
+    # Numbers, booleans and dates never need escaping
+    text = series.astype(str)
+    if escapeHtml and kind not in 'biufcmM':
+        text = text.str.replace('&', '&amp;', regex = False)
+        text = text.str.replace('<', '&lt;', regex = False)
+        text = text.str.replace('>', '&gt;', regex = False)
+
+    # Match the way pandas displays missing values
+    missing = 'NaN' if kind in 'fc' else ('NaT' if kind in 'mM' else 'None')
+    return text.where(series.notna(), missing)
+
+def pandasTable(df) -> str:
+    '''Renders a pandas dataframe as an html table using vectorised string operations'''
+    # Build every row of the table as a single string...
+    body = ''
+    if len(df.index) and len(df.columns):
+        cells = [CELL_OPEN + pandasCell(df.iloc[:, i]) + CELL_CLOSE for i in range(len(df.columns))]
+        rows = ROW_OPEN + functools.reduce(operator.add, cells) + ROW_CLOSE
+
+        # ...then join the rows together in one pass
+        body = ''.join(rows.tolist())
+
+    return header(df.columns) + body + TABLE_CLOSE
+
+def columnText(df) -> list:
+    '''Formats each column of a polars or pandas dataframe as a list of text values'''
+    if isinstance(df, pl.DataFrame):
+        try:
+            text = df.select(polarsCell(name, dtype, escapeHtml = False) for name, dtype in df.schema.items())
+            return [series.to_list() for series in text.get_columns()]
+        except pl.exceptions.PolarsError:
+            # Types that can't be formatted go through pandas
+            df = df.to_pandas()
+
+    return [pandasCell(df.iloc[:, i], escapeHtml = False).tolist() for i in range(len(df.columns))]
+
+def virtualData(df) -> str:
+    '''The rows of a virtual table as columnar json'''
+    data = {
+        'rows': len(df),
+        'data': columnText(df),
+    }
+
+    # NOTE: "</" is escaped so a value can't close the script block early
+    return json.dumps(data, ensure_ascii = False, separators = (',', ':')).replace('</', '<\\/')
+
+def virtualTable(df, tableID: str, code: str = None) -> tuple:
+    '''
+    Renders the table header and embeds the rows as columnar json. The report's
+    virtual table script draws only the rows that are scrolled into view.
+    Returns the code in three pieces: the table and the start of the data block,
+    the json data, and the end of the data block.
+        code:   The json data if it was already made, see virtualData
+    '''
+    if code is None:
+        code = virtualData(df)
+
+    return (
+        f'<div class = "dataframe-container virtual-table" id = "{tableID}">\n'
+        + header(df.columns) + TABLE_CLOSE
+        + '\n</div>\n'
+        + f'<script type = "application/json" id = "{tableID}_data">',
+        code,
+        '</script>\n',
+    )
+
+def useVirtual(df, mode: str) -> bool:
+    '''Checks whether the dataframe should be written as a virtual table'''
+    if mode not in TABLE_MODES:
+        raise ValueError(f'Unknown table mode {mode!r}, expected one of {TABLE_MODES}')
+
+    # Only polars & pandas dataframes can be embedded
+    if not isFrame(df):
+        return False
+
+    return mode == 'virtual' or (mode == 'auto' and len(df) > VIRTUAL_ROWS)
+
+def renderTable(df) -> str:
+    '''Renders a polars or pandas dataframe as an html table'''
+    # Polars dataframes are rendered natively
+    if isinstance(df, pl.DataFrame):
+        return polarsTable(df)
+
+    # Pandas has its own fast path
+    if type(df).__module__.startswith('pandas'):
+        return pandasTable(df)
+
+    # Otherwise fall back to the object's own html
+    return df.to_html(index = False)
+
+def isFrame(df) -> bool:
+    '''Checks whether the object is a polars or pandas dataframe'''
+    return isinstance(df, pl.DataFrame) or type(df).__module__.startswith('pandas')
+
+def summaryFrame(df) -> pl.DataFrame:
+    '''Converts a pandas dataframe to polars for summarize. Columns polars can't convert,
+    e.g. object columns mixing numbers and text, are summarized as text.
+    NOTE: If any column fails the columns are named by position, so repeated names work'''
+    try:
+        return pl.from_pandas(df, include_index = False)
+    except Exception:
+        pass
+
+    # Convert one column at a time, so only the columns that fail are read as text
+    columns = []
+    for i in range(len(df.columns)):
+        series = df.iloc[:, i]
+        try:
+            columns.append(pl.from_pandas(series).alias(str(i)))
+        except Exception:
+            text = [None if missing else str(value) for value, missing in zip(series.tolist(), series.isna())]
+            columns.append(pl.Series(str(i), text, dtype = pl.String))
+    return pl.DataFrame(columns)
+
+def summarize(df) -> pl.DataFrame:
+    '''
+    Summarizes each column of a polars or pandas dataframe: its type, missing values,
+    minimum, quartiles and maximum. Every statistic is computed in a single polars query.
+    '''
+    # Pandas dataframes keep their own type names
+    dtypes = [str(dtype) for dtype in (df.schema.values() if isinstance(df, pl.DataFrame) else df.dtypes)]
+    names = [str(name) for name in df.columns]
+    if not isinstance(df, pl.DataFrame):
+        df = summaryFrame(df)
+
+    # Statistics for each column, named by column index so any column name works
+    exprs = []
+    for i, (name, dtype) in enumerate(df.schema.items()):
+        col = pl.col(name)
+        exprs.append(col.null_count().alias(f'{i}_nulls'))
+
+        # Only ordered types have a range
+        if dtype.is_numeric() or dtype.is_temporal() or dtype in (pl.String, pl.Boolean):
+            exprs += [col.min().cast(pl.String).alias(f'{i}_min'), col.max().cast(pl.String).alias(f'{i}_max')]
+
+        # Only numbers have quantiles
+        if dtype.is_numeric():
+            exprs += [
+                col.quantile(q, interpolation = 'nearest').cast(pl.String).alias(f'{i}_{q}')
+                for q in SUMMARY_QUANTILES
+            ]
+    stats = df.select(exprs).row(0, named = True) if exprs else {}
+
+    # One row per column
+    quantiles = [f'{q:.0%}' for q in SUMMARY_QUANTILES]
+    rows = {'column': [], 'dtype': [], 'nulls': [], 'min': [], **{q: [] for q in quantiles}, 'max': []}
+    for i, name in enumerate(names):
+        rows['column'].append(name)
+        rows['dtype'].append(dtypes[i])
+        rows['nulls'].append(stats[f'{i}_nulls'])
+        rows['min'].append(stats.get(f'{i}_min'))
+        rows['max'].append(stats.get(f'{i}_max'))
+        for q, label in zip(SUMMARY_QUANTILES, quantiles):
+            rows[label].append(stats.get(f'{i}_{q}'))
+
+    return pl.DataFrame(rows, schema = {key: pl.Int64 if key == 'nulls' else pl.String for key in rows})
+
+def sampleRows(df, count: int, seed: int):
+    '''A repeatable random sample of rows, kept in their original order'''
+    if isinstance(df, pl.DataFrame):
+        return df.sample(count, seed = seed, shuffle = False)
+
+    import numpy as np
+    rows = np.random.default_rng(seed).choice(len(df), count, replace = False)
+    rows.sort()
+    return df.iloc[rows]
+
+def limitRows(df, maxRows: int = None, policy: str = 'head', seed: int = 0) -> tuple:
+    '''
+    Applies a row policy to a polars or pandas dataframe.
+    Returns the dataframe to write to the report and a note saying what was left out,
+    or None if nothing was.
+        maxRows:    Most rows to write. If None, only the 'summary' policy changes the dataframe.
+        policy:     One of ROW_POLICIES
+        seed:       Seed for the 'sample' policy, so the same rows are picked every run
+    '''
+    if policy not in ROW_POLICIES:
+        raise ValueError(f'Unknown row policy {policy!r}, expected one of {ROW_POLICIES}')
+
+    # Other objects are written as they are
+    if not isFrame(df):
+        return df, None
+
+    rows = len(df)
+    if policy == 'summary':
+        if maxRows is not None and rows <= maxRows:
+            return df, None
+        return summarize(df), f'Summary of {rows:,} rows and {len(df.columns):,} columns, the rows are not shown.'
+
+    if maxRows is None or rows <= maxRows:
+        return df, None
+
+    if policy == 'head':
+        return df.head(maxRows), f'Showing the first {maxRows:,} of {rows:,} rows.'
+
+    if policy == 'tail':
+        return df.tail(maxRows), f'Showing the last {maxRows:,} of {rows:,} rows.'
+
+    if policy == 'headTail':
+        head, tail = (maxRows + 1) // 2, maxRows // 2
+        if isinstance(df, pl.DataFrame):
+            limited = pl.concat([df.head(head), df.tail(tail)])
+        else:
+            limited = df.iloc[list(range(head)) + list(range(rows - tail, rows))]
+        return limited, f'Showing the first {head:,} and last {tail:,} of {rows:,} rows, {rows - maxRows:,} rows are not shown.'
+
+    return sampleRows(df, maxRows, seed), f'Showing a sample of {maxRows:,} of {rows:,} rows (seed {seed}).'
+
+def tableNote(note: str) -> str:
+    '''Code for the note under a table that was shortened'''
+    return f'<p class = "dataframe-note"><em>{escape(note)}</em></p>\n'
@@ -0,0 +1,20 @@
+'''
+Purpose: test exporting a report to a directory, where only the pages that changed are rewritten
+'''
+
+import streamlit as st
+from streamlit_report import report
+r = report.Report()
+
+def main():
+    r.write('# Directory export')
+    r.text_input('Change this text and export again, only this page is rewritten')
+
+    directory = st.text_input('Directory', value = 'report_output')
+    if st.button('Export'):
+        st.write(r.exportDirectory(directory))
+
+    r.download()
+
+if __name__ == '__main__':
+    main()
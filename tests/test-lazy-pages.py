@@ -0,0 +1,28 @@
+'''
+Purpose: test reports with lazyPages, where hidden pages and charts are only drawn when they're shown
+'''
+
+import streamlit as st
+from streamlit_report import report
+import altair as alt
+import polars as pl
+r = report.Report(lazyPages = True, tableMode = 'auto')
+
+def main():
+    df = pl.DataFrame({
+        'x' : pl.int_range(5000, eager = True),
+        'y' : (pl.int_range(5000, eager = True) * 0.01).sin(),
+    })
+
+    # Charts further down the page are drawn as they're scrolled into view
+    for i in range(30):
+        r.write(f'## Chart {i}')
+        r.altair_chart(alt.Chart(df.head(200).to_pandas()).mark_line().encode(x = 'x', y = 'y'))
+
+    # Virtual tables on pages opened later are loaded when the page is opened
+    r.dataframe(df)
+
+    r.download()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+'''
+Purpose: test deferred reports rendered by a pool of worker processes
+'''
+
+import streamlit as st
+from streamlit_report import report
+import altair as alt
+import polars as pl
+chartFormat = st.selectbox('chart format', ['interactive', 'svg'])
+r = report.Report(deferred = True, workers = 2, tableMode = 'auto', chartFormat = chartFormat)
+
+def main():
+    # Frames large enough to be sent to the workers, as static and virtual tables
+    df = pl.DataFrame({
+        'id'    : pl.int_range(5000, eager = True),
+        'value' : pl.int_range(5000, eager = True) * 0.5,
+        'label' : pl.int_range(5000, eager = True).cast(pl.String) + ' <b>not bold</b>',
+    })
+    r.dataframe(df, mode = 'static')
+    r.dataframe(df.to_pandas(), mode = 'static')
+    r.dataframe(df)
+    r.dataframe(df.to_pandas())
+
+    # Charts are converted in the workers too
+    chart = alt.Chart(df.head(200).to_pandas()).mark_line().encode(x = 'id', y = 'value')
+    r.altair_chart(chart)
+    r.altair_chart(chart.mark_point())
+
+    r.download()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+'''
+Purpose: test r.dataframe with row policies for large dataframes
+'''
+
+import streamlit as st
+from streamlit_report import report
+import polars as pl
+r = report.Report(maxRows = 1000, rowPolicy = 'headTail')
+
+def main():
+    rows = st.number_input('rows', value = 100_000, step = 10_000)
+    df = pl.DataFrame({
+        'id'    : pl.int_range(rows, eager = True),
+        'value' : pl.int_range(rows, eager = True) * 0.5,
+        'label' : pl.int_range(rows, eager = True).cast(pl.String) + ' <b>not bold</b>',
+    })
+
+    # Report's policy, the first and last rows
+    r.dataframe(df)
+
+    # Per call policies
+    r.dataframe(df, maxRows = 20, rowPolicy = 'head')
+    r.dataframe(df, maxRows = 20, rowPolicy = 'tail')
+    r.dataframe(df, maxRows = 20, rowPolicy = 'sample', seed = 7)
+    r.dataframe(df.to_pandas(), rowPolicy = 'summary')
+
+    # Summary of an object column mixing numbers and text
+    mixed = df.to_pandas()
+    mixed['mixed'] = [i if i % 2 else str(i) for i in range(len(mixed))]
+    r.dataframe(mixed, rowPolicy = 'summary')
+
+    # Small dataframe, written in full
+    r.dataframe(df.head(10))
+
+    r.download()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+'''
+Purpose: test saving a report to a snapshot file and restoring it into a new session
+'''
+
+import io
+import streamlit as st
+from streamlit_report import report
+r = report.Report()
+
+def main():
+    r.write('# Snapshot')
+    r.text_input('Some text to keep in the report')
+
+    # Save the report as it is now
+    snapshot = io.BytesIO()
+    r.saveSnapshot(snapshot)
+    st.download_button('Save snapshot', snapshot.getvalue(), 'report.snapshot.zip')
+
+    # Restore a saved report, e.g. after restarting the server
+    # NOTE: The app is run again once the report is restored
+    uploaded = st.file_uploader('Restore snapshot', type = 'zip')
+    if uploaded is not None and st.button('Restore'):
+        r.restoreSnapshot(uploaded)
+
+    r.download()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+'''
+Purpose: test r.altair_chart with charts converted to images
+'''
+
+import streamlit as st
+from streamlit_report import report
+import altair as alt
+import polars as pl
+chartFormat = st.selectbox('chart format', ['svg', 'png', 'interactive'])
+r = report.Report(chartFormat = chartFormat)
+
+def main():
+    df = pl.DataFrame({
+        'x' : pl.int_range(200, eager = True),
+        'y' : (pl.int_range(200, eager = True) * 0.1).sin(),
+    })
+
+    # Many charts, each is converted once and then reused from the cache
+    for i in range(20):
+        r.altair_chart(alt.Chart(df.to_pandas()).mark_line().encode(x = 'x', y = 'y').properties(title = f'chart {i}'))
+
+    r.download()
+
+if __name__ == '__main__':
+    main()
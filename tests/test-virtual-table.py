@@ -0,0 +1,42 @@
+'''
+Purpose: test r.dataframe with virtual tables
+'''
+
+import streamlit as st
+from streamlit_report import report
+import polars as pl
+import datetime
+r = report.Report(tableMode = 'auto')
+
+def main():
+    # Large dataframe, written as a virtual table
+    rows = st.number_input('rows', value = 100_000, step = 10_000)
+    df = pl.DataFrame({
+        'id'    : pl.int_range(rows, eager = True),
+        'value' : pl.int_range(rows, eager = True) * 0.5,
+        'label' : pl.int_range(rows, eager = True).cast(pl.String) + ' <b>not bold</b>',
+    })
+    r.dataframe(df)
+
+    # Small dataframe, written as a static table
+    r.dataframe(df.head(10))
+
+    # Forced static table
+    r.dataframe(df.head(2000), mode = 'static')
+
+    # Column types without a plain string cast, in both kinds of table
+    types = pl.DataFrame({
+        'duration'  : [datetime.timedelta(days = 1, seconds = 3.5), None],
+        'binary'    : [b'<b>\xff', None],
+        'array'     : pl.Series([[1, 2], [3, 4]], dtype = pl.Array(pl.Int64, 2)),
+        'struct'    : [{'tag': '<i>'}, {'tag': None}],
+        'boolean'   : [True, None],
+        'date'      : [datetime.date(2024, 1, 1), None],
+    })
+    r.dataframe(types, mode = 'static')
+    r.dataframe(types, mode = 'virtual')
+
+    r.download()
+
+if __name__ == '__main__':
+    main()